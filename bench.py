@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+import time
+import random
+import asyncio
+import argparse
+import statistics
+from   typing import List, Tuple
+
+from utp      import UTPSocket
+from printing import *
+
+
+"""
+
+Compares uTP (LEDBAT) with TCP on loopback, both going through the same emulated
+bottleneck: packets leave at most rate bytes per second, queue behind each other,
+then travel for delay seconds (netem-style, in-process). uTP uses the emulation of
+UTPSocket; TCP goes through a relay that applies the same link to the stream, with
+a router-like buffer of --buffer bytes. The relay terminates TCP, so its ACKs are
+not delayed (this only favors TCP's throughput). Every 10 ms the backlog of the
+link is sampled: the time a packet sent now would wait before leaving is the
+queuing delay the transfer adds for anyone sharing the link
+
+"""
+
+
+class Link:
+    def __init__(self, delay: float, rate: float):
+        self.delay        = delay
+        self.rate         = rate
+        self.link_free_at = 0.0
+
+    def schedule(self, size: int) -> float:
+        # Returns when a packet of size bytes sent now reaches the other end
+        loop              = asyncio.get_running_loop()
+        departs           = max(loop.time(), self.link_free_at) + size / self.rate
+        self.link_free_at = departs
+        return departs + self.delay
+
+    def backlog(self) -> float:
+        # Seconds a packet sent now would wait before leaving
+        return max(self.link_free_at - asyncio.get_running_loop().time(), 0.0)
+
+
+class Relay:
+    def __init__(self, link: Link, target: Tuple[str, int], buffer: int):
+        self.link   = link
+        self.target = target
+        self.buffer = buffer
+        self.server = None
+        self.tasks  = set()
+
+    async def __forward(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            # A full buffer stops reading, so TCP flow control pushes back on the sender
+            while self.link.backlog() * self.link.rate >= self.buffer:
+                await asyncio.sleep(0.001)
+
+            data = await reader.read(1380)
+            if not data:
+                break
+            loop.call_at(self.link.schedule(len(data)), writer.write, data)
+
+        await asyncio.sleep(self.link.backlog() + self.link.delay)
+        writer.close()
+
+    async def __pipe(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        while data := await reader.read(1 << 16):
+            writer.write(data)
+            await writer.drain()
+
+    async def __handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.tasks.add(asyncio.current_task())
+        target_reader, target_writer = await asyncio.open_connection(*self.target)
+        await asyncio.gather(self.__forward(reader, target_writer), self.__pipe(target_reader, writer))
+        writer.close()
+
+    async def start(self) -> int:
+        self.server = await asyncio.start_server(self.__handle, host="127.0.0.1", port=0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        # Both ends are closed by now, the connections finish on their own
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.server.close()
+
+
+async def sample(link, samples: List[float], interval: float = 0.01):
+    # Link and UTPSocket both track when their emulated link becomes free
+    loop = asyncio.get_running_loop()
+    while True:
+        samples.append(max(link.link_free_at - loop.time(), 0.0))
+        await asyncio.sleep(interval)
+
+
+async def transfer(reader: asyncio.StreamReader, writer, payload: bytes, link) -> Tuple[float, List[float]]:
+    samples = []
+    sampler = asyncio.create_task(sample(link, samples))
+    started = time.monotonic()
+
+    writer.write(payload)
+    await writer.drain()
+    await reader.readexactly(len(payload))
+
+    elapsed = time.monotonic() - started
+    sampler.cancel()
+    return elapsed, samples
+
+
+async def bench_utp(payload: bytes, delay: float, rate: float) -> Tuple[float, List[float]]:
+    # Both ends delay their packets, only the sender's data fills the link
+    sender   = await UTPSocket.create(host="127.0.0.1", port=0, delay=delay, rate=rate)
+    receiver = await UTPSocket.create(host="127.0.0.1", port=0, delay=delay)
+
+    accept_task = asyncio.create_task(receiver.accept())
+    _, writer   = await sender.connect("127.0.0.1", receiver.transport.get_extra_info("sockname")[1])
+    reader, _   = await accept_task
+
+    try:
+        return await transfer(reader, writer, payload, sender)
+    finally:
+        sender.close()
+        receiver.close()
+
+
+async def bench_tcp(payload: bytes, delay: float, rate: float, buffer: int) -> Tuple[float, List[float]]:
+    received = asyncio.Queue()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        await received.put((reader, writer))
+
+    server     = await asyncio.start_server(handle, host="127.0.0.1", port=0)
+    link       = Link(delay=delay, rate=rate)
+    relay      = Relay(link=link, target=("127.0.0.1", server.sockets[0].getsockname()[1]), buffer=buffer)
+    relay_port = await relay.start()
+
+    _, writer        = await asyncio.open_connection("127.0.0.1", relay_port)
+    reader, receiver = await received.get()
+
+    try:
+        return await transfer(reader, writer, payload, link)
+    finally:
+        writer.close()
+        receiver.close()
+        await relay.stop()
+        server.close()
+
+
+def report(name: str, size: int, elapsed: float, samples: List[float]):
+    samples = sorted(samples) or [0.0]
+    p95     = samples[min(int(len(samples) * 0.95), len(samples) - 1)]
+    print_blue(f"[BENCH]: {name}: {size / elapsed / 1024:.0f} KiB/s, queuing delay "
+               f"mean {statistics.mean(samples) * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms, "
+               f"max {samples[-1] * 1000:.0f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="uTP vs TCP over an emulated link")
+    parser.add_argument("--size", help="Bytes to transfer", type=int, default=4 << 20)
+    parser.add_argument("--delay", help="One-way delay in seconds", type=float, default=0.02)
+    parser.add_argument("--rate", help="Link rate in bytes per second", type=float, default=1 << 20)
+    parser.add_argument("--buffer", help="Bytes the link buffers for TCP", type=int, default=1 << 20)
+    args = parser.parse_args()
+
+    payload = random.randbytes(args.size)
+    print_green(f"[BENCH]: {args.size} bytes, {args.delay * 1000:.0f} ms delay, "
+                f"{args.rate / 1024:.0f} KiB/s link, {args.buffer} bytes of TCP buffer")
+
+    elapsed, samples = await bench_utp(payload, args.delay, args.rate)
+    report("uTP", args.size, elapsed, samples)
+
+    elapsed, samples = await bench_tcp(payload, args.delay, args.rate, args.buffer)
+    report("TCP", args.size, elapsed, samples)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -16,6 +16,9 @@ class Block:
         self.length = length       # Length of the block
         self.data   = data         # The block data (or placeholder)
         self.status = status       # The status of the block (REQUESTED, DOWNLOADED, NOT_REQUESTED)
+        self.requested_at = 0.0    # Last time the block was requested
+        self.duplicates   = 0      # Extra requests issued for the block
+        self.source       = None   # Address of the peer the data came from
 
     def __repr__(self):
         return f"Block(piece_index={self.index}, offset={self.offset}, status={self.status.name})"
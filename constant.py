@@ -1 +1,43 @@
-WAITING = 0.05
\ No newline at end of file
+WAITING = 0.05
+
+LISTEN_PORT = 6881   # Default port peers connect to
+
+# Streaming mode
+STREAM_WINDOW           = 8       # Pieces ahead of the read cursor with a deadline
+STREAM_PIECE_DEADLINE   = 2.0     # Seconds of slack granted per piece of distance
+STREAM_REQUEST_TIMEOUT  = 1.0     # Minimum seconds before a block is requested again
+STREAM_MAX_DUPLICATES   = 3       # Maximum extra requests for a single block
+STREAM_RETRY_TIMEOUT    = 15.0    # Seconds before any other lost request is sent again
+STREAM_HTTP_PORT        = 8080    # Default port of the local HTTP server
+
+# Local Service Discovery (BEP 14)
+LSD_ADDRESS   = "239.192.152.143"
+LSD_PORT      = 6771
+LSD_INTERVAL  = 300     # Seconds between two announces
+LSD_REPLY     = 60      # Seconds before answering the same peer's announce again
+
+# Web seeds (BEP 19)
+WEBSEED_CONNECTIONS  = 4      # Concurrent piece requests per server
+WEBSEED_RETRY        = 10     # Seconds to wait after a failed request
+WEBSEED_TIMEOUT      = 60     # Seconds allowed for a whole piece request
+WEBSEED_MAX_FAILURES = 3      # Pieces failing verification before a server is dropped
+
+# uTP (BEP 29)
+UTP_MSS               = 1380      # Payload bytes per packet
+UTP_TARGET            = 100000    # LEDBAT target queuing delay (microseconds)
+UTP_GAIN              = 1.0       # LEDBAT gain
+UTP_ALLOWED_INCREASE  = 2         # Max cwnd growth beyond the flight size, in packets
+UTP_BASE_HISTORY      = 10        # Minutes of base delay history
+UTP_RECV_WINDOW       = 1 << 20   # Advertised receive window
+UTP_SEND_BUFFER       = 1 << 16   # Unsent bytes before drain() blocks
+UTP_MIN_RTO           = 0.5       # Seconds
+UTP_MAX_RETRANSMITS   = 6         # Timeouts before the connection is reset
+UTP_TICK              = 0.05      # Seconds between two timer checks
+UTP_BACKLOG           = 16        # Connections waiting for accept() before new ones are reset
+UTP_CONNECT_TIMEOUT   = 5         # Seconds to wait for a uTP connection before using TCP
+
+# BitTorrent v2 (BEP 52)
+MERKLE_BLOCK_SIZE  = 16384   # Bytes covered by a merkle leaf
+HASH_WORKERS       = 4       # Threads of the hashing executor
+HASH_PEERS         = 3       # Peers asked for the leaf hashes of a failed piece
+HASH_TIMEOUT       = 10      # Seconds to wait for leaf hashes before dropping the whole piece
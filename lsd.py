@@ -0,0 +1,132 @@
+import time
+import socket
+import struct
+import random
+import asyncio
+from   typing import Callable, Dict, Any, Optional
+
+from constant import *
+from printing import *
+
+
+class LocalDiscovery(asyncio.DatagramProtocol):
+    def __init__(self, info_hash: bytes, port: int,
+                       on_peer:   Callable[[Dict[str, Any]], None],
+                       interface: str = "0.0.0.0"):
+
+        self.info_hash = info_hash
+        self.port      = port
+        self.on_peer   = on_peer
+        self.interface = interface
+
+        # The cookie lets us recognize (and ignore) our own announces
+        self.cookie    = "%08x" % random.getrandbits(32)
+
+        # Last time we answered each peer, so that nodes joining late find us
+        # without waiting for the next periodic announce
+        self.replied   = {}
+
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self.task:      Optional[asyncio.Task] = None
+
+    """
+
+    BEP 14 announces are HTTP-like messages sent to a well-known multicast group.
+    Every client on the LAN joins the group, so each announce reaches all of them,
+    including other instances running on the same host
+
+    """
+
+    def create_announce(self) -> bytes:
+        return (f"BT-SEARCH * HTTP/1.1\r\n"
+                f"Host: {LSD_ADDRESS}:{LSD_PORT}\r\n"
+                f"Port: {self.port}\r\n"
+                f"Infohash: {self.info_hash.hex()}\r\n"
+                f"cookie: {self.cookie}\r\n"
+                f"\r\n\r\n").encode("ascii")
+
+    @staticmethod
+    def parse_announce(data: bytes) -> Optional[Dict[str, Any]]:
+        try:
+            lines = data.decode("ascii").split("\r\n")
+        except UnicodeDecodeError:
+            return None
+
+        if not lines or lines[0] != "BT-SEARCH * HTTP/1.1":
+            return None
+
+        headers = {}
+        hashes  = []
+        for line in lines[1:]:
+            if ":" not in line:
+                continue
+            key, value = line.split(":", 1)
+            key, value = key.strip().lower(), value.strip()
+            if key == "infohash":
+                hashes.append(value.lower())
+            else:
+                headers[key] = value
+
+        if "port" not in headers or not hashes:
+            return None
+
+        try:
+            port = int(headers["port"])
+        except ValueError:
+            return None
+
+        return {"port": port, "infohashes": hashes, "cookie": headers.get("cookie")}
+
+    def connection_made(self, transport: asyncio.DatagramTransport):
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr):
+        msg = self.parse_announce(data)
+
+        if msg is None or msg["cookie"] == self.cookie:
+            return
+
+        if self.info_hash.hex() in msg["infohashes"]:
+            print_green(f"[LSD]: Found local peer {addr[0]}:{msg['port']}")
+            self.on_peer({"ip": addr[0], "port": msg["port"], "local": True})
+            self.__reply((addr[0], msg["port"]))
+
+    def __reply(self, peer):
+        now = time.monotonic()
+        if peer in self.replied and now - self.replied[peer] < LSD_REPLY:
+            return
+
+        self.replied[peer] = now
+        self.transport.sendto(self.create_announce(), (LSD_ADDRESS, LSD_PORT))
+
+    def error_received(self, exc: Exception):
+        pass
+
+    async def __announce(self):
+        while True:
+            self.transport.sendto(self.create_announce(), (LSD_ADDRESS, LSD_PORT))
+            await asyncio.sleep(LSD_INTERVAL)
+
+    async def start(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, "SO_REUSEPORT"):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(("", LSD_PORT))
+
+        # Join the multicast group, and loop announces back to this host
+        membership = struct.pack("4s4s", socket.inet_aton(LSD_ADDRESS), socket.inet_aton(self.interface))
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(self.interface))
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+
+        loop = asyncio.get_running_loop()
+        await loop.create_datagram_endpoint(lambda: self, sock=sock)
+        self.task = asyncio.create_task(self.__announce())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+        if self.transport is not None:
+            self.transport.close()
@@ -7,6 +7,11 @@ import sys
 from torrent import Torrent
 from tracker import Tracker
 from manager import Manager
+from streamer import Streamer
+from lsd      import LocalDiscovery
+from utp      import UTPSocket
+from server   import Server
+from constant import STREAM_HTTP_PORT, LISTEN_PORT
 from printing import *
 
 
@@ -14,6 +19,13 @@ async def main():
     # Set up argument parsing
     parser = argparse.ArgumentParser(description="Torrent Downloader")
     parser.add_argument("t", help="Path to the torrent file", type=str)
+    parser.add_argument("--port", help="Port other peers connect to", type=int, default=LISTEN_PORT)
+    parser.add_argument("--seed", help="Keep uploading to other peers after the download completes", action="store_true")
+    parser.add_argument("--stream", help="Download sequentially and serve the file over HTTP", action="store_true")
+    parser.add_argument("--utp", help="Connect to and accept peers over uTP (BEP 29), falling back to TCP", action="store_true")
+    parser.add_argument("--lsd", help="Discover peers on the LAN (BEP 14)", action="store_true")
+    parser.add_argument("--lsd-interface", help="Interface address used for LAN discovery", type=str, default="0.0.0.0")
+    parser.add_argument("--http-port", help="Port of the local HTTP server", type=int, default=STREAM_HTTP_PORT)
 
     # Parse the command line arguments
     args = parser.parse_args()
@@ -42,13 +54,51 @@ async def main():
     tracker = Tracker(torrent, peer_id)
     
     # Announce to the tracker and get the peers
-    peers = await tracker.announce(port=6881)
+    peers = await tracker.announce(port=args.port)
+    
+    # Open the socket shared by all uTP connections (optional)
+    utp = None
+    if args.utp:
+        utp = await UTPSocket.create(port=args.port)
     
     # Create a new manager
-    manager = Manager(torrent=torrent, peers=peers)
+    manager = Manager(torrent=torrent, peers=peers, streaming=args.stream, utp=utp)
+    
+    # Accept connections from other peers on the announced port
+    server = Server(manager=manager, port=args.port, utp=utp)
+    await server.start()
+    
+    # Start the local HTTP server (optional)
+    streamer = None
+    if args.stream:
+        streamer = Streamer(manager=manager, name=torrent.name, port=args.http_port)
+        await streamer.start()
+    
+    # Discover peers on the LAN (optional)
+    lsd = None
+    if args.lsd:
+        lsd = LocalDiscovery(info_hash=torrent.info_hash, port=args.port, on_peer=manager.add_peer,
+                             interface=args.lsd_interface)
+        await lsd.start()
     
     # Start the download
     await manager.download()
+    
+    # Keep uploading (and serving the file) until interrupted
+    try:
+        if args.seed or streamer is not None:
+            await asyncio.Event().wait()
+    finally:
+        if lsd is not None:
+            lsd.stop()
+        
+        if utp is not None:
+            utp.close()
+        
+        if streamer is not None:
+            await streamer.stop()
+        
+        await server.stop()
 
 if __name__ == "__main__":
     asyncio.run(main())
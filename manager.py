@@ -1,16 +1,26 @@
+import time
 import asyncio
+import hashlib
 import random
-from   typing import List
+import aiohttp
+from   typing import List, Optional, Tuple
+from   concurrent.futures import ThreadPoolExecutor
+
+import merkle
 
 from constant import *
 from printing import *
 from peer     import Peer
 from block    import Block, BlockStatus
 from torrent  import Torrent
+from webseed  import WebSeed
+from utp      import UTPSocket
 
 
 class Manager:
-    def __init__(self, torrent: Torrent, peers: List[Peer]):
+    def __init__(self, torrent: Torrent, peers: List[Peer], streaming: bool = False, utp: UTPSocket = None):
+        self.torrent        = torrent
+        self.utp            = utp
         self.files          = torrent.files
         self.pieces         = torrent.pieces
         self.piece_size     = torrent.piece_length
@@ -18,37 +28,104 @@ class Manager:
         self.num_pieces     = torrent.num_pieces
         self.total_size     = torrent.total_size
         self.block_size     = min(pow(2, 16), self.piece_size)
+        self.piece_hashes   = torrent.piece_hashes
         self.peers          = peers
+        self.streaming      = streaming
         
         self.consume_queue  = asyncio.Queue()
         self.request_queue  = asyncio.Queue()
         self.complete       = asyncio.Event()
+        
+        # v2 torrents verify 16 KiB blocks against merkle trees
+        self.hash_queue     = None
+        if self.piece_hashes:
+            self.block_size = MERKLE_BLOCK_SIZE
+            self.hash_queue = asyncio.Queue()
 
         # Create a random peer_id
-        peer_id = b'-PY0001-' + bytes(random.randint(0, 9) for _ in range(12))
+        self.peer_id = b'-PY0001-' + bytes(random.randint(0, 9) for _ in range(12))
     
         # Generate the list of blocks
         self.blocks = self.__create_blocks()
         
+        # Index blocks by piece, and by (piece, offset)
+        self.piece_blocks = [[] for _ in range(self.num_pieces)]
+        self.block_map    = {}
+        for block in self.blocks:
+            self.piece_blocks[block.index].append(block)
+            self.block_map[(block.index, block.offset)] = block
+        
+        # Blocks still missing in each piece
+        self.missing = [len(blocks) for blocks in self.piece_blocks]
+        
+        # Track verified pieces, and wake up readers waiting for them
+        self.verified       = [False] * self.num_pieces
+        self.piece_verified = asyncio.Condition()
+        
+        # Hashing runs off the event loop
+        self.executor = ThreadPoolExecutor(max_workers=HASH_WORKERS)
+        
+        # Trusted leaf hashes per piece, and failed pieces waiting for them
+        self.leaf_hashes  = {}
+        self.awaiting     = {}
+        
+        # Pieces fetched by web seeds, until verified or dropped
+        self.fetching = set()
+        
+        # Verification failures by source (peer IP or web seed URL)
+        self.failures = {}
+        
+        # Progress
+        self.downloaded_size = 0
+        
+        # Piece the consumer is currently reading (streaming mode)
+        self.cursor = 0
+        
         # Track pieces availability
         self.availability = [0] * self.num_pieces
         
         # Create the list of all peers
-        self.peers = [Peer(peer_info=peer, info_hash=self.info_hash, peer_id=peer_id,
-                           consume_queue=self.consume_queue,
-                           request_queue=self.request_queue, complete=self.complete,
-                           availability=self.availability) for peer in peers]
+        self.peers = [self.__create_peer(peer) for peer in peers]
+        self.downloading = False
+
+    def __create_peer(self, peer_info: dict) -> Peer:
+        return Peer(peer_info=peer_info, info_hash=self.info_hash, peer_id=self.peer_id,
+                    consume_queue=self.consume_queue,
+                    request_queue=self.request_queue, complete=self.complete,
+                    availability=self.availability, utp=self.utp,
+                    hash_queue=self.hash_queue)
+
+    def add_peer(self, peer_info: dict):
+        # Peers discovered while downloading (e.g., on the LAN) are started right away
+        peer = next((peer for peer in self.peers
+                     if peer.ip == peer_info["ip"] and peer.port == peer_info["port"]), None)
+
+        if peer is None:
+            peer = self.__create_peer(peer_info)
+            self.peers.append(peer)
+        elif peer_info.get("local", False):
+            # A tracker peer that turns out to be on the LAN gets its priority
+            peer.local = True
+        else:
+            return
+
+        if self.downloading:
+            self.__start_peer(peer)
+
+    def __start_peer(self, peer: Peer):
+        if not peer.started:
+            peer.started = True
+            asyncio.create_task(peer.download())
 
     def __create_blocks(self) -> List[Block]:
         blocks = []
 
         for piece_index in range(self.num_pieces):
-            piece_start = piece_index * self.piece_size
-            piece_end   = min(piece_start + self.piece_size, self.total_size)
-            offset      = 0
+            piece_length = self.torrent.piece_size(piece_index)
+            offset       = 0
 
-            while offset < (piece_end - piece_start):
-                block_length = min(self.block_size, piece_end - piece_start - offset)
+            while offset < piece_length:
+                block_length = min(self.block_size, piece_length - offset)
                 blocks.append(Block(index=piece_index, offset=offset, length=block_length))
                 offset += block_length
 
@@ -64,10 +141,6 @@ class Manager:
     """
 
     async def __consume_data(self):
-        count = 0
-        total_blocks = len(self.blocks)
-        
-        downloaded_size = 0
         total_size      = sum(block.length for block in self.blocks)
         batch_size      = 20
 
@@ -91,32 +164,176 @@ class Manager:
                 continue
             
             # Process the batch of blocks dequeued
+            completed = set()
             for res, ip, port in batch:
                 res: Block
 
-                for block in self.blocks:
-                    block: Block
-                    if block.index == res.index and block.offset == res.offset:
-                        if block.status != BlockStatus.DOWNLOADED:
-                            block.status = BlockStatus.DOWNLOADED
-                            block.data       = res.data
-                            count           += 1
-                            downloaded_size += block.length
-                        break
+                block = self.block_map.get((res.index, res.offset))
+                if block is not None and block.status != BlockStatus.DOWNLOADED:
+                    block.status          = BlockStatus.DOWNLOADED
+                    block.data            = res.data
+                    block.source          = ip
+                    self.downloaded_size += block.length
+                    self.missing[block.index] -= 1
+                    
+                    if self.missing[block.index] == 0:
+                        completed.add(block.index)
+            
+            # Verify the pieces completed by this batch
+            if completed:
+                await self.__verify_pieces(completed)
+
+                async with self.piece_verified:
+                    self.piece_verified.notify_all()
             
             # Calculate and print progress after the batch
-            progress = (downloaded_size / total_size) * 100
-            print_blue(f"[info]: downloading... {downloaded_size} out of {total_size} bytes, {progress:.2f}%)")
+            progress = (self.downloaded_size / total_size) * 100
+            print_blue(f"[info]: downloading... {self.downloaded_size} out of {total_size} bytes, {progress:.2f}%)")
 
             await asyncio.sleep(WAITING)
 
-            if count >= total_blocks:
+            if all(self.verified):
                 self.complete.set()
                 print_green("[MANAGER]: All blocks downloaded successfully!")
 
+    """
+    
+    Completed pieces are hashed in a thread pool. v1 pieces are checked against their
+    SHA1 hash and downloaded again as a whole when it does not match. v2 pieces hash
+    each 16 KiB block into a merkle leaf: when the piece root does not match, peers
+    are asked for the trusted leaves of the piece, and only the blocks whose leaf
+    differs are downloaded again
+    
+    """
+
+    def __hash_piece(self, index: int, data: bytes) -> Tuple[bool, Optional[List[bytes]]]:
+        if not self.piece_hashes:
+            return (hashlib.sha1(data).digest() == self.pieces[index * 20:(index + 1) * 20], None)
+
+        piece  = self.piece_hashes[index]
+        leaves = merkle.leaf_hashes(data)
+
+        if index in self.leaf_hashes:
+            return (leaves == self.leaf_hashes[index][:len(leaves)], leaves)
+        return (merkle.root(leaves, piece["width"]) == piece["hash"], leaves)
+
+    async def __verify_pieces(self, indexes: set):
+        loop    = asyncio.get_running_loop()
+        indexes = list(indexes)
+        results = await asyncio.gather(*(
+            loop.run_in_executor(self.executor, self.__hash_piece, index, self.read_piece(index))
+            for index in indexes))
+
+        for index, (valid, leaves) in zip(indexes, results):
+            if valid:
+                self.verified[index] = True
+            elif index in self.leaf_hashes:
+                self.__reset_bad_blocks(index, leaves)
+            elif self.piece_hashes and self.piece_hashes[index]["width"] >= 2:
+                # Peers asked (still pending) and peers already tried, by address
+                request = {"leaves": leaves, "asked": set(), "tried": set()}
+                if not self.__request_hashes(index, request, HASH_PEERS):
+                    print_yellow(f"[MANAGER]: Piece {index} failed verification, requesting it again")
+                    self.__reset_blocks(self.piece_blocks[index])
+                    continue
+
+                print_yellow(f"[MANAGER]: Piece {index} failed verification, asking peers for its leaf hashes")
+                self.awaiting[index] = request
+                loop.call_later(HASH_TIMEOUT, self.__hash_timeout, index, request)
+            else:
+                print_yellow(f"[MANAGER]: Piece {index} failed verification, requesting it again")
+                self.__reset_blocks(self.piece_blocks[index])
+
+    def __reset_blocks(self, blocks: List[Block]):
+        # Every source that took part in a failed piece is blamed once
+        for source in {block.source for block in blocks if block.source is not None}:
+            self.failures[source] = self.failures.get(source, 0) + 1
+
+        for block in blocks:
+            block.status          = BlockStatus.NOT_REQUESTED
+            block.data            = b""
+            block.duplicates      = 0
+            self.downloaded_size -= block.length
+            self.missing[block.index] += 1
+            self.fetching.discard(block.index)
+
+    def __reset_bad_blocks(self, index: int, leaves: List[bytes]):
+        # Blocks are MERKLE_BLOCK_SIZE long, so block i of the piece is leaf i
+        trusted = self.leaf_hashes[index]
+        bad     = [block for i, block in enumerate(self.piece_blocks[index]) if leaves[i] != trusted[i]]
+
+        for block in bad:
+            print_yellow(f"[MANAGER]: Block {block.offset} of piece {index} from {block.source} is corrupted, requesting it again")
+        self.__reset_blocks(bad or self.piece_blocks[index])
+
+    def __request_hashes(self, index: int, request: dict, count: int) -> bool:
+        piece = self.piece_hashes[index]
+        peers = [peer for peer in self.peers
+                 if peer.connected and peer.supports_v2 and (peer.ip, peer.port) not in request["tried"]]
+
+        asked = 0
+        for peer in random.sample(peers, len(peers)):
+            if asked >= count:
+                break
+            if peer.request_hashes(pieces_root=piece["root"], index=piece["leaf"], length=piece["width"]):
+                request["asked"].add((peer.ip, peer.port))
+                request["tried"].add((peer.ip, peer.port))
+                asked += 1
+
+        return asked > 0
+
+    def __hash_timeout(self, index: int, request: dict):
+        # Nobody sent the leaf hashes in time: drop the whole piece
+        if self.awaiting.get(index) is request:
+            del self.awaiting[index]
+            print_yellow(f"[MANAGER]: No leaf hashes for piece {index}, requesting it again")
+            self.__reset_blocks(self.piece_blocks[index])
+
+    def __hashes_refused(self, index: int, request: dict, address: tuple):
+        # Ask another peer in place of the one that rejected (or sent bad hashes)
+        request["asked"].discard(address)
+
+        if not request["asked"] and not self.__request_hashes(index, request, 1):
+            del self.awaiting[index]
+            print_yellow(f"[MANAGER]: Every peer refused the leaf hashes for piece {index}, requesting it again")
+            self.__reset_blocks(self.piece_blocks[index])
+
+    async def __consume_hashes(self):
+        while not self.complete.is_set():
+            (pieces_root, base_layer, index, length, proof_layers, hashes), ip, port = await self.hash_queue.get()
+            self.hash_queue.task_done()
+
+            if base_layer != 0:
+                continue
+
+            for piece_index, request in list(self.awaiting.items()):
+                piece = self.piece_hashes[piece_index]
+                start = piece["leaf"] - index
+
+                if piece["root"] != pieces_root or start < 0 or start + piece["width"] > length:
+                    continue
+
+                # A hash reject carries no hashes. Leaves are trusted once they add up to the piece hash
+                trusted = hashes[start:start + piece["width"]] if hashes is not None else None
+                if trusted is None or len(trusted) != piece["width"] or merkle.root(trusted, piece["width"]) != piece["hash"]:
+                    if trusted is not None:
+                        print_yellow(f"[MANAGER]: Invalid leaf hashes for piece {piece_index} from {ip}")
+                    if (ip, port) in request["asked"]:
+                        self.__hashes_refused(piece_index, request, (ip, port))
+                    continue
+
+                del self.awaiting[piece_index]
+                self.leaf_hashes[piece_index] = trusted
+                self.__reset_bad_blocks(piece_index, request["leaves"])
+
     async def __request_data(self, batch_size: int = 20):
         while not self.complete.is_set():
             
+            if self.streaming:
+                await self.__request_stream(batch_size)
+                await asyncio.sleep(WAITING)
+                continue
+            
             batch = [
                 block for block in random.sample(self.blocks, len(self.blocks))
                 if block.status == BlockStatus.NOT_REQUESTED
@@ -141,6 +358,69 @@ class Manager:
     
     """
     
+    In streaming mode, blocks are requested in order starting from the piece the
+    consumer is reading. Pieces inside the window get a deadline that grows with
+    their distance from the cursor: a block still missing after its deadline is
+    requested again, so pieces close to the cursor get more duplicate requests.
+    Any other block still missing after STREAM_RETRY_TIMEOUT is requested again too,
+    since requests can be lost (e.g., choked or disconnected peers)
+    
+    """
+
+    async def __request_stream(self, batch_size: int):
+        now   = time.monotonic()
+        slots = batch_size - self.request_queue.qsize()
+        batch = []
+
+        # Pieces behind the cursor come last, once everything ahead is requested
+        order = list(range(self.cursor, self.num_pieces)) + list(range(0, self.cursor))
+
+        for index in order:
+            if len(batch) >= slots:
+                break
+
+            distance = (index - self.cursor) % self.num_pieces
+
+            for block in self.piece_blocks[index]:
+                block: Block
+                if len(batch) >= slots:
+                    break
+
+                if block.status == BlockStatus.NOT_REQUESTED:
+                    batch.append(block)
+
+                elif block.status == BlockStatus.REQUESTED:
+                    if distance < STREAM_WINDOW and block.duplicates < STREAM_MAX_DUPLICATES:
+                        deadline = STREAM_REQUEST_TIMEOUT + distance * STREAM_PIECE_DEADLINE
+                    else:
+                        deadline = STREAM_RETRY_TIMEOUT
+
+                    if now - block.requested_at > deadline:
+                        block.duplicates += 1
+                        batch.append(block)
+
+        for block in batch:
+            block.status       = BlockStatus.REQUESTED
+            block.requested_at = now
+            await self.request_queue.put(block)
+
+    def seek(self, offset: int):
+        self.cursor = min(offset // self.piece_size, self.num_pieces - 1)
+
+    async def wait_piece(self, index: int) -> bool:
+        # Returns True when the caller had to wait for the piece
+        if self.verified[index]:
+            return False
+
+        async with self.piece_verified:
+            await self.piece_verified.wait_for(lambda: self.verified[index])
+        return True
+
+    def read_piece(self, index: int) -> bytes:
+        return b"".join(block.data for block in self.piece_blocks[index])
+
+    """
+    
     The method download is used to trigger the runtime of each peer
     
     """
@@ -149,9 +429,29 @@ class Manager:
     async def download(self):
         producer_task = asyncio.create_task(self.__request_data())
         consumer_task = asyncio.create_task(self.__consume_data())
-
-        for peer in random.sample(self.peers, min(40, len(self.peers))):
-            asyncio.create_task(peer.download())
+        hashes_task   = asyncio.create_task(self.__consume_hashes()) if self.hash_queue is not None else None
+
+        # LAN peers always get a connection, WAN peers share the remaining slots
+        local  = [peer for peer in self.peers if peer.local]
+        remote = [peer for peer in self.peers if not peer.local]
+
+        for peer in local + random.sample(remote, max(0, min(40 - len(local), len(remote)))):
+            self.__start_peer(peer)
+        self.downloading = True
+
+        # Web seeds share one keep-alive connection pool
+        session  = None
+        webseeds = []
+        if self.torrent.url_list:
+            connector = aiohttp.TCPConnector(limit_per_host=WEBSEED_CONNECTIONS)
+            session   = aiohttp.ClientSession(connector=connector)
+            for url in self.torrent.url_list:
+                webseed = WebSeed(url=url, torrent=self.torrent, session=session,
+                                  consume_queue=self.consume_queue,
+                                  request_queue=self.request_queue, complete=self.complete,
+                                  block_size=self.block_size, verified=self.verified, pending=self.fetching,
+                                  failures=self.failures)
+                webseeds.append(asyncio.create_task(webseed.download()))
 
         await self.complete.wait()
 
@@ -167,6 +467,22 @@ class Manager:
             await consumer_task
         except asyncio.CancelledError:
             pass
+
+        if hashes_task is not None:
+            hashes_task.cancel()
+            try:
+                await hashes_task
+            except asyncio.CancelledError:
+                pass
+
+        for task in webseeds:
+            task.cancel()
+        await asyncio.gather(*webseeds, return_exceptions=True)
+
+        self.executor.shutdown(wait=False)
+
+        if session is not None:
+            await session.close()
         
         print_green("[MANAGER]: All downloads finished. Saving file...")
         self.save(self.files[0]["path"])
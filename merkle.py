@@ -0,0 +1,34 @@
+import hashlib
+from   typing import List
+
+from constant import *
+
+
+ZERO_HASH = bytes(32)
+
+
+def next_power_of_two(n: int) -> int:
+    return 1 << max(n - 1, 0).bit_length()
+
+def leaf_hashes(data: bytes) -> List[bytes]:
+    # Hash every 16 KiB block of data in one go, the last one may be shorter
+    view = memoryview(data)
+    return [hashlib.sha256(view[i:i + MERKLE_BLOCK_SIZE]).digest()
+            for i in range(0, len(data), MERKLE_BLOCK_SIZE)]
+
+def pad_hash(width: int) -> bytes:
+    # Root of a subtree made of width zero leaves
+    digest = ZERO_HASH
+    while width > 1:
+        digest = hashlib.sha256(digest + digest).digest()
+        width //= 2
+    return digest
+
+def root(hashes: List[bytes], width: int, pad: bytes = ZERO_HASH) -> bytes:
+    # Root of a tree with width leaves (a power of two), missing leaves set to pad
+    layer = list(hashes) + [pad] * (width - len(hashes))
+
+    while len(layer) > 1:
+        layer = [hashlib.sha256(layer[i] + layer[i + 1]).digest() for i in range(0, len(layer), 2)]
+
+    return layer[0]
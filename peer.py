@@ -6,6 +6,7 @@ from constant  import *
 from printing  import *
 from protocol  import Message
 from block     import Block, BlockStatus
+from utp       import UTPSocket
 
 
 class Peer:
@@ -15,10 +16,14 @@ class Peer:
                        consume_queue: asyncio.Queue, 
                        request_queue: asyncio.Queue,
                        complete:      asyncio.Event,
-                       availability:  list[int]):
+                       availability:  list[int],
+                       utp:           Optional[UTPSocket] = None,
+                       hash_queue:    Optional[asyncio.Queue] = None):
         
         self.ip            = peer_info["ip"]
         self.port          = peer_info["port"]
+        self.local         = peer_info.get("local", False)
+        self.started       = False
         self.info_hash     = info_hash
         self.peer_id       = peer_id
         self.choked        = True
@@ -32,6 +37,11 @@ class Peer:
         self.complete = complete
         
         self.availability = availability
+        self.utp          = utp
+        
+        # Only v2 torrents receive merkle hashes (and advertise BEP 52 support)
+        self.hash_queue   = hash_queue
+        self.supports_v2  = False    # Set by the handshake when the peer speaks BEP 52
         
     async def __read_timeout(self, n: int, timeout: int = 5):
         try:
@@ -52,8 +62,9 @@ class Peer:
 
     """
     
-    Before starting sharing data, the client has to establish a TCP connection.
-    Once the TCP connection is established, the client has to handshake the peer.
+    Before starting sharing data, the client has to establish a connection, over
+    uTP when enabled and over TCP otherwise (or when the peer does not answer uTP).
+    Once the connection is established, the client has to handshake the peer.
     The handshake process requires the client to send and receive a specific
     sequence of BitTorrent bytes
     
@@ -61,6 +72,26 @@ class Peer:
 
 
     async def __establish(self, timeout: int = 30) -> bool:
+        # Close the previous connection, a uTP one would otherwise stay on the socket
+        if self.writer is not None:
+            try:
+                self.writer.close()
+            except Exception:
+                pass
+        self.reader, self.writer = None, None
+
+        if self.utp is not None:
+            try:
+                self.reader, self.writer = await asyncio.wait_for(
+                    self.utp.connect(host=self.ip, port=self.port), timeout=UTP_CONNECT_TIMEOUT)
+
+                print_green(f"[PEER={self.ip}]: Connection established (uTP)")
+                self.connected = True
+                return True
+            except Exception as err:
+                #print_yellow(f"[PEER={self.ip}]: uTP connection failed - {err}")
+                pass
+
         try:
             self.reader, self.writer = await asyncio.wait_for(
                 asyncio.open_connection(host=self.ip, port=self.port), timeout=timeout)
@@ -83,7 +114,8 @@ class Peer:
 
         try:
             # Send handshake
-            msg = Message.create_handshake(info_hash=self.info_hash, peer_id=self.peer_id)
+            msg = Message.create_handshake(info_hash=self.info_hash, peer_id=self.peer_id,
+                                           v2=self.hash_queue is not None)
             self.writer.write(msg)
             await self.writer.drain()
 
@@ -93,6 +125,7 @@ class Peer:
 
             if msg is None:
                 return False
+            self.supports_v2 = msg[2]
 
             # Send interested message
             interested_msg = Message.create_interested()
@@ -173,10 +206,34 @@ class Peer:
                         await self.consume_queue.put((block, self.ip, self.port))
                         await asyncio.sleep(WAITING)
 
+                    elif msg_id == Message.HASHES and self.hash_queue is not None:
+                        res = Message.parse_hashes(data[1:])
+                        if res is not None:
+                            await self.hash_queue.put((res, self.ip, self.port))
+
+                    elif msg_id == Message.HASH_REJECT and self.hash_queue is not None:
+                        # Forwarded without hashes, so the manager can ask someone else
+                        res = Message.parse_hash_request(data[1:])
+                        if res is not None:
+                            await self.hash_queue.put((res + (None,), self.ip, self.port))
+
             except Exception as err:
                 #print_yellow(f"[PEER={self.ip}]: Error while consuming data: {err}")
                 return
 
+    def request_hashes(self, pieces_root: bytes, index: int, length: int) -> bool:
+        # Ask for a range of leaf hashes, answered asynchronously by a hashes message.
+        # v1-only peers would not know the message (and may drop the connection)
+        if not self.connected or self.writer is None or self.hash_queue is None or not self.supports_v2:
+            return False
+
+        try:
+            self.writer.write(Message.create_hash_request(pieces_root=pieces_root, base_layer=0,
+                                                          index=index, length=length, proof_layers=0))
+            return True
+        except Exception as err:
+            return False
+
     """
     
     The method download is used to trigger the runtime of each peer
@@ -1,5 +1,5 @@
 import struct
-from   typing import Optional, Tuple
+from   typing import List, Optional, Tuple
 
 class Message:
 
@@ -14,12 +14,18 @@ class Message:
     PIECE             = 7
     CANCEL            = 8
     PORT              = 9
+    HASH_REQUEST      = 21
+    HASHES            = 22
+    HASH_REJECT       = 23
+
+    # Last reserved handshake byte
+    V2_BIT            = 0x10
     
     @staticmethod
-    def create_handshake(info_hash: bytes, peer_id: bytes) -> bytes:
+    def create_handshake(info_hash: bytes, peer_id: bytes, v2: bool = False) -> bytes:
         pstrlen  = bytes([19])  # BitTorrent protocol string length
         pstr     = b'BitTorrent protocol'
-        reserved = bytes([0] * 8)  # Reserved bytes
+        reserved = bytes([0] * 7 + [Message.V2_BIT if v2 else 0])  # Reserved bytes (BEP 52 support bit)
 
         # Ensure info_hash and peer_id are byte sequences (this is important!)
         if not isinstance(info_hash, bytes):
@@ -30,7 +36,7 @@ class Message:
         return pstrlen + pstr + reserved + info_hash + peer_id
     
     @staticmethod
-    def parse_handshake(data: bytes) -> Optional[Tuple[bytes, bytes]]:
+    def parse_handshake(data: bytes) -> Optional[Tuple[bytes, bytes, bool]]:
         if len(data) < 68:
             return None
             
@@ -42,11 +48,12 @@ class Message:
         if pstr != b'BitTorrent protocol':
             return None
             
-        # Extract info_hash and peer_id
+        # Extract info_hash, peer_id and whether the peer speaks BEP 52
         info_hash = data[28:48]
         peer_id   = data[48:68]
+        v2        = bool(data[27] & Message.V2_BIT)
         
-        return (info_hash, peer_id)
+        return (info_hash, peer_id, v2)
     
     @staticmethod
     def create_message(message_id: int, payload: bytes = b'') -> bytes:
@@ -79,6 +86,14 @@ class Message:
         payload = struct.pack('>I', piece_index)
         return Message.create_message(Message.HAVE, payload)
     
+    @staticmethod
+    def create_bitfield(pieces: list) -> bytes:
+        bitfield = bytearray((len(pieces) + 7) // 8)
+        for i, have in enumerate(pieces):
+            if have:
+                bitfield[i // 8] |= 0x80 >> (i % 8)
+        return Message.create_message(Message.BITFIELD, bytes(bitfield))
+    
     @staticmethod
     def create_request(index: int, begin: int, length: int) -> bytes:
         payload = struct.pack('>III', index, begin, length)
@@ -97,4 +112,40 @@ class Message:
     @staticmethod
     def create_port(port: int) -> bytes:
         payload = struct.pack('>H', port)
-        return Message.create_message(Message.PORT, payload)
\ No newline at end of file
+        return Message.create_message(Message.PORT, payload)
+    
+    @staticmethod
+    def create_hash_request(pieces_root: bytes, base_layer: int, index: int, length: int, proof_layers: int) -> bytes:
+        payload = pieces_root + struct.pack('>IIII', base_layer, index, length, proof_layers)
+        return Message.create_message(Message.HASH_REQUEST, payload)
+    
+    @staticmethod
+    def create_hashes(pieces_root: bytes, base_layer: int, index: int, length: int, proof_layers: int, hashes: bytes) -> bytes:
+        payload = pieces_root + struct.pack('>IIII', base_layer, index, length, proof_layers) + hashes
+        return Message.create_message(Message.HASHES, payload)
+    
+    @staticmethod
+    def create_hash_reject(pieces_root: bytes, base_layer: int, index: int, length: int, proof_layers: int) -> bytes:
+        payload = pieces_root + struct.pack('>IIII', base_layer, index, length, proof_layers)
+        return Message.create_message(Message.HASH_REJECT, payload)
+    
+    @staticmethod
+    def parse_hash_request(payload: bytes) -> Optional[Tuple[bytes, int, int, int, int]]:
+        # Payload of a hash request (or hash reject) message, without the message ID
+        if len(payload) != 48:
+            return None
+        
+        base_layer, index, length, proof_layers = struct.unpack('>IIII', payload[32:48])
+        return (payload[:32], base_layer, index, length, proof_layers)
+    
+    @staticmethod
+    def parse_hashes(payload: bytes) -> Optional[Tuple[bytes, int, int, int, int, List[bytes]]]:
+        # Payload of a hashes message, without the message ID
+        if len(payload) < 48 or (len(payload) - 48) % 32 != 0:
+            return None
+        
+        pieces_root = payload[:32]
+        base_layer, index, length, proof_layers = struct.unpack('>IIII', payload[32:48])
+        hashes = [payload[i:i + 32] for i in range(48, len(payload), 32)]
+        
+        return (pieces_root, base_layer, index, length, proof_layers, hashes)
\ No newline at end of file
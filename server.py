@@ -0,0 +1,106 @@
+import struct
+import asyncio
+from   typing import Optional
+
+from constant import *
+from printing import *
+from protocol import Message
+from manager  import Manager
+from utp      import UTPSocket
+
+
+class Server:
+    def __init__(self, manager: Manager, port: int = LISTEN_PORT, host: str = "0.0.0.0",
+                       utp: Optional[UTPSocket] = None):
+        self.manager = manager
+        self.port    = port
+        self.host    = host
+        self.utp     = utp       # Bound to the same port, accepts uTP connections
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.task:   Optional[asyncio.Task] = None
+        self.writers = set()
+
+    """
+
+    Other clients (e.g., LAN peers found with BEP 14) connect to the listen port.
+    After the handshake they receive a bitfield of the verified pieces and are
+    unchoked right away; pieces verified later are announced with have messages,
+    and requests are answered only for verified pieces. TCP and uTP connections
+    are served the same way
+
+    """
+
+    async def __send_haves(self, writer: asyncio.StreamWriter, sent: set):
+        while True:
+            async with self.manager.piece_verified:
+                await self.manager.piece_verified.wait()
+
+            for index, verified in enumerate(self.manager.verified):
+                if verified and index not in sent:
+                    sent.add(index)
+                    writer.write(Message.create_have(index))
+            await writer.drain()
+
+    async def __handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        ip         = writer.get_extra_info("peername")[0]
+        haves_task = None
+        self.writers.add(writer)
+
+        try:
+            res = await asyncio.wait_for(reader.readexactly(68), timeout=5)
+            msg = Message.parse_handshake(data=res)
+            if msg is None or msg[0] != self.manager.info_hash:
+                return
+
+            sent = {index for index, verified in enumerate(self.manager.verified) if verified}
+            writer.write(Message.create_handshake(info_hash=self.manager.info_hash, peer_id=self.manager.peer_id,
+                                                  v2=self.manager.hash_queue is not None))
+            writer.write(Message.create_bitfield(self.manager.verified))
+            writer.write(Message.create_unchoke())
+            await writer.drain()
+
+            haves_task = asyncio.create_task(self.__send_haves(writer, sent))
+
+            while True:
+                (len_value,) = struct.unpack(">I", await reader.readexactly(4))
+                if len_value == 0:
+                    continue  # Keep-alive
+
+                data = await reader.readexactly(len_value)
+                if data[0] != Message.REQUEST:
+                    continue
+
+                index, begin, length = struct.unpack(">III", data[1:13])
+                if 0 <= index < self.manager.num_pieces and self.manager.verified[index] and length <= 1 << 17:
+                    block = self.manager.read_piece(index)[begin:begin + length]
+                    writer.write(Message.create_piece(index=index, begin=begin, block=block))
+                    await writer.drain()
+
+        except Exception as err:
+            #print_yellow(f"[SERVER]: Connection with {ip} closed: {err}")
+            pass
+        finally:
+            if haves_task is not None:
+                haves_task.cancel()
+            self.writers.discard(writer)
+            writer.close()
+
+    async def __accept_utp(self):
+        while True:
+            reader, writer = await self.utp.accept()
+            asyncio.create_task(self.__handle(reader, writer))
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.__handle, host=self.host, port=self.port)
+        if self.utp is not None:
+            self.task = asyncio.create_task(self.__accept_utp())
+        print_green(f"[SERVER]: Listening for peers on port {self.port}")
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+        if self.server is not None:
+            self.server.close()
+            for writer in list(self.writers):
+                writer.close()
+            await self.server.wait_closed()
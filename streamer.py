@@ -0,0 +1,116 @@
+import re
+import time
+from   aiohttp import web
+from   typing  import Optional, Tuple
+
+from constant import *
+from printing import *
+from manager  import Manager
+
+
+class Streamer:
+    def __init__(self, manager: Manager, name: str, port: int = STREAM_HTTP_PORT):
+        self.manager    = manager
+        self.name       = name
+        self.port       = port
+        self.total_size = manager.total_size
+        self.piece_size = manager.piece_size
+        self.runner: Optional[web.AppRunner] = None
+
+        # Playback statistics
+        self.started_at  = time.monotonic()
+        self.first_byte  = None    # Seconds from start to the first byte served
+        self.stalls      = 0       # Reads that had to wait for a piece after the first byte
+        self.stall_time  = 0.0     # Seconds spent in those waits
+
+    def __parse_range(self, header: Optional[str]) -> Optional[Tuple[int, int]]:
+        if header is None:
+            return (0, self.total_size - 1)
+
+        match = re.fullmatch(r"bytes=(\d*)-(\d*)", header.strip())
+        if match is None or match.group(1) == match.group(2) == "":
+            return None
+
+        if match.group(1) == "":
+            # Suffix range: the last N bytes
+            start = max(self.total_size - int(match.group(2)), 0)
+            end   = self.total_size - 1
+        else:
+            start = int(match.group(1))
+            end   = int(match.group(2)) if match.group(2) else self.total_size - 1
+            end   = min(end, self.total_size - 1)
+
+        if start > end:
+            return None
+        return (start, end)
+
+    """
+
+    Every request moves the manager's read cursor to the requested offset, so that
+    pieces close to it are downloaded first. The response is written piece by piece,
+    and each write blocks only until that piece has been verified
+
+    """
+
+    async def __handle(self, request: web.Request) -> web.StreamResponse:
+        byte_range = self.__parse_range(request.headers.get("Range"))
+        if byte_range is None:
+            return web.Response(status=416, headers={"Content-Range": f"bytes */{self.total_size}"})
+
+        start, end = byte_range
+        status     = 206 if "Range" in request.headers else 200
+        response   = web.StreamResponse(status=status, headers={
+            "Accept-Ranges"  : "bytes",
+            "Content-Length" : str(end - start + 1),
+            "Content-Type"   : "application/octet-stream",
+        })
+        if status == 206:
+            response.headers["Content-Range"] = f"bytes {start}-{end}/{self.total_size}"
+        await response.prepare(request)
+
+        if request.method == "HEAD":
+            return response
+
+        offset = start
+        while offset <= end:
+            index = offset // self.piece_size
+            self.manager.seek(offset)
+
+            # Waiting for the first piece is startup latency, not a stall
+            waiting = time.monotonic()
+            if await self.manager.wait_piece(index) and self.first_byte is not None:
+                self.stalls     += 1
+                self.stall_time += time.monotonic() - waiting
+
+            piece_start = index * self.piece_size
+            piece_end   = min(piece_start + self.piece_size, end + 1)
+            data        = self.manager.read_piece(index)[offset - piece_start:piece_end - piece_start]
+
+            await response.write(data)
+            if self.first_byte is None:
+                self.first_byte = time.monotonic() - self.started_at
+                print_green(f"[STREAMER]: First byte served after {self.first_byte:.2f} seconds")
+            offset += len(data)
+
+        await response.write_eof()
+        return response
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_route("GET",  "/{path:.*}", self.__handle)
+        app.router.add_route("HEAD", "/{path:.*}", self.__handle)
+
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host="127.0.0.1", port=self.port).start()
+        print_green(f"[STREAMER]: Serving {self.name} on http://127.0.0.1:{self.port}/")
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+        self.print_stats()
+
+    def print_stats(self):
+        first_byte = f"{self.first_byte:.2f} seconds" if self.first_byte is not None else "never"
+        print_blue(f"[STREAMER]: Time to first byte: {first_byte}")
+        print_blue(f"[STREAMER]: Stalls: {self.stalls} ({self.stall_time:.2f} seconds)")
@@ -0,0 +1,53 @@
+import os
+import sys
+import socket
+import hashlib
+from   typing import Callable, Optional
+
+import pytest
+
+# The client modules live at the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from torrent import Torrent
+from manager import Manager
+from block   import Block
+
+
+@pytest.fixture
+def make_torrent(tmp_path):
+    def make(data: bytes, piece_length: int, extra: dict = None) -> Torrent:
+        pieces = b"".join(hashlib.sha1(data[i:i + piece_length]).digest()
+                          for i in range(0, len(data), piece_length))
+        meta   = {b"announce": b"http://127.0.0.1/announce",
+                  b"info": {b"name": str(tmp_path / "download.bin").encode("utf-8"),
+                            b"piece length": piece_length, b"pieces": pieces, b"length": len(data)}}
+        meta.update(extra or {})
+        return Torrent(meta)
+    return make
+
+
+@pytest.fixture
+def free_port():
+    def port(type: int = socket.SOCK_STREAM) -> int:
+        with socket.socket(socket.AF_INET, type) as sock:
+            sock.bind(("127.0.0.1", 0))
+            return sock.getsockname()[1]
+    return port
+
+
+@pytest.fixture
+def fake_peer():
+    # Drains the manager's request queue and answers from data; alter may replace
+    # a block's payload, or return None to drop the request
+    async def serve(manager: Manager, data: bytes, alter: Callable[[Block, bytes], Optional[bytes]] = None):
+        while True:
+            block   = await manager.request_queue.get()
+            start   = block.index * manager.piece_size + block.offset
+            payload = data[start:start + block.length]
+            if alter is not None:
+                payload = alter(block, payload)
+                if payload is None:
+                    continue
+            await manager.consume_queue.put((Block(block.index, block.offset, block.length, payload), "peer", 1))
+    return serve
@@ -0,0 +1,77 @@
+import asyncio
+import random
+
+from manager import Manager
+from server  import Server
+from lsd     import LocalDiscovery
+from block   import BlockStatus
+
+
+def test_parse_announce_ignores_other_messages():
+    lsd = LocalDiscovery(info_hash=bytes(20), port=7000, on_peer=lambda peer: None)
+    msg = LocalDiscovery.parse_announce(lsd.create_announce())
+
+    assert msg == {"port": 7000, "infohashes": [bytes(20).hex()], "cookie": lsd.cookie}
+    assert LocalDiscovery.parse_announce(b"GET / HTTP/1.1\r\n\r\n") is None
+
+
+def share(torrent, data: bytes, piece_length: int, ports: tuple, delay: float, timeout: float):
+    async def run():
+        # The first instance already has every piece
+        seeder = Manager(torrent=torrent, peers=[])
+        for block in seeder.blocks:
+            start        = block.index * piece_length + block.offset
+            block.data   = data[start:start + block.length]
+            block.status = BlockStatus.DOWNLOADED
+        seeder.verified = [True] * seeder.num_pieces
+
+        leecher = Manager(torrent=torrent, peers=[])
+
+        seeder_port, leecher_port = ports
+        server = Server(manager=seeder, port=seeder_port, host="127.0.0.1")
+        await server.start()
+
+        discovery = [LocalDiscovery(info_hash=torrent.info_hash, port=seeder_port,
+                                    on_peer=seeder.add_peer, interface="127.0.0.1"),
+                     LocalDiscovery(info_hash=torrent.info_hash, port=leecher_port,
+                                    on_peer=leecher.add_peer, interface="127.0.0.1")]
+        await discovery[0].start()
+        await asyncio.sleep(delay)
+        await discovery[1].start()
+
+        try:
+            await asyncio.wait_for(leecher.download(), timeout=timeout)
+        finally:
+            for lsd in discovery:
+                lsd.stop()
+            await server.stop()
+        return leecher
+
+    return asyncio.run(run())
+
+
+def test_instances_on_one_host_transfer_over_lan(make_torrent, free_port):
+    piece_length = 1 << 14
+    data         = random.randbytes(8 * piece_length + 100)
+    torrent      = make_torrent(data, piece_length)
+    ports        = (free_port(), free_port())
+
+    leecher = share(torrent, data, piece_length, ports, delay=0, timeout=30)
+
+    assert [(peer.port, peer.local) for peer in leecher.peers] == [(ports[0], True)]
+    with open(torrent.files[0]["path"], "rb") as f:
+        assert f.read() == data
+
+
+def test_late_instance_finds_seeder_before_next_announce(make_torrent, free_port):
+    piece_length = 1 << 14
+    data         = random.randbytes(8 * piece_length)
+    torrent      = make_torrent(data, piece_length)
+    ports        = (free_port(), free_port())
+
+    # The seeder's periodic announce went out a second before the leecher joined
+    leecher = share(torrent, data, piece_length, ports, delay=1, timeout=10)
+
+    assert [(peer.port, peer.local) for peer in leecher.peers] == [(ports[0], True)]
+    with open(torrent.files[0]["path"], "rb") as f:
+        assert f.read() == data
@@ -0,0 +1,51 @@
+import asyncio
+import random
+
+import manager as manager_module
+from manager import Manager
+
+
+def test_streaming_recovers_lost_requests(make_torrent, fake_peer, monkeypatch):
+    monkeypatch.setattr(manager_module, "STREAM_REQUEST_TIMEOUT", 0.05)
+    monkeypatch.setattr(manager_module, "STREAM_PIECE_DEADLINE", 0.05)
+    monkeypatch.setattr(manager_module, "STREAM_RETRY_TIMEOUT", 0.2)
+
+    piece_length = 1 << 14
+    data         = random.randbytes(20 * piece_length)
+    torrent      = make_torrent(data, piece_length)
+
+    async def run():
+        manager = Manager(torrent=torrent, peers=[], streaming=True)
+        seen    = set()
+
+        # A peer that loses the first request for every block
+        def lose_first(block, payload):
+            if (block.index, block.offset) not in seen:
+                seen.add((block.index, block.offset))
+                return None
+            return payload
+
+        task = asyncio.create_task(fake_peer(manager, data, lose_first))
+        await asyncio.wait_for(manager.download(), timeout=30)
+        task.cancel()
+        return manager
+
+    manager = asyncio.run(run())
+
+    assert all(manager.verified)
+    with open(torrent.files[0]["path"], "rb") as f:
+        assert f.read() == data
+
+
+def test_tracker_peer_found_on_lan_gets_priority(make_torrent):
+    torrent = make_torrent(bytes(1 << 14), 1 << 14)
+
+    async def run():
+        manager = Manager(torrent=torrent, peers=[{"ip": "10.0.0.2", "port": 6881}])
+        manager.add_peer({"ip": "10.0.0.2", "port": 6881, "local": True})
+        return manager
+
+    manager = asyncio.run(run())
+
+    assert len(manager.peers) == 1
+    assert manager.peers[0].local
@@ -0,0 +1,143 @@
+import asyncio
+import random
+
+import merkle
+import manager as manager_module
+from torrent  import Torrent
+from manager  import Manager
+from peer     import Peer
+from protocol import Message
+
+
+PIECE_LENGTH = 1 << 16
+
+
+def make_v2_torrent(tmp_path, data: bytes) -> Torrent:
+    leaves = PIECE_LENGTH // merkle.MERKLE_BLOCK_SIZE
+    layer  = [merkle.root(merkle.leaf_hashes(data[i:i + PIECE_LENGTH]), leaves)
+              for i in range(0, len(data), PIECE_LENGTH)]
+    root   = merkle.root(layer, merkle.next_power_of_two(len(layer)), merkle.pad_hash(leaves))
+    name   = str(tmp_path / "download.bin").encode("utf-8")
+
+    return Torrent({b"announce": b"http://127.0.0.1/announce",
+                    b"piece layers": {root: b"".join(layer)},
+                    b"info": {b"name": name, b"piece length": PIECE_LENGTH, b"meta version": 2,
+                              b"file tree": {name: {b"": {b"length": len(data), b"pieces root": root}}}}})
+
+
+class HashPeer:
+    # Answers hash requests with the file's leaves, or rejects them
+    def __init__(self, manager: Manager, port: int, leaves: list, reject: bool, v2: bool = True):
+        self.manager     = manager
+        self.ip          = "127.0.0.1"
+        self.port        = port
+        self.leaves      = leaves
+        self.reject      = reject
+        self.connected   = True
+        self.supports_v2 = v2
+        self.local       = False
+        self.started     = False
+        self.asked       = 0
+
+    async def download(self):
+        pass
+
+    def request_hashes(self, pieces_root: bytes, index: int, length: int) -> bool:
+        self.asked += 1
+        if not self.supports_v2:
+            return False
+        hashes = None if self.reject else (self.leaves + [merkle.ZERO_HASH] * length)[index:index + length]
+        self.manager.hash_queue.put_nowait(((pieces_root, 0, index, length, 0, hashes), self.ip, self.port))
+        return True
+
+
+def download(torrent: Torrent, data: bytes, rejects: list, corrupted: tuple, fake_peer, v1_peers: int = 0):
+    async def run():
+        manager = Manager(torrent=torrent, peers=[])
+        leaves  = merkle.leaf_hashes(data)
+        manager.peers = [HashPeer(manager, 7000 + i, leaves, reject) for i, reject in enumerate(rejects)]
+        manager.peers += [HashPeer(manager, 8000 + i, leaves, False, v2=False) for i in range(v1_peers)]
+        served  = []
+        bad     = {corrupted}
+
+        # The corrupted block is served with zeros the first time only
+        def corrupt(block, payload):
+            served.append((block.index, block.offset))
+            if (block.index, block.offset) in bad:
+                bad.discard((block.index, block.offset))
+                return bytes(block.length)
+            return payload
+
+        task = asyncio.create_task(fake_peer(manager, data, corrupt))
+        await asyncio.wait_for(manager.download(), timeout=10)
+        task.cancel()
+        return manager, served
+
+    return asyncio.run(run())
+
+
+def test_only_the_corrupted_block_is_downloaded_again(tmp_path, fake_peer, monkeypatch):
+    monkeypatch.setattr(manager_module, "HASH_PEERS", 1)
+    data    = random.randbytes(5 * PIECE_LENGTH + 7000)
+    torrent = make_v2_torrent(tmp_path, data)
+
+    manager, served = download(torrent, data, rejects=[True, False], corrupted=(2, 16384), fake_peer=fake_peer)
+
+    # The first peer asked may reject, the manager then asks the other one
+    assert served.count((2, 16384)) == 2
+    assert len([offset for index, offset in served if index == 2]) == 5
+    with open(torrent.files[0]["path"], "rb") as f:
+        assert f.read() == data
+
+
+def test_piece_is_dropped_once_every_peer_rejected(tmp_path, fake_peer, monkeypatch):
+    monkeypatch.setattr(manager_module, "HASH_PEERS", 1)
+    monkeypatch.setattr(manager_module, "HASH_TIMEOUT", 60)
+    data    = random.randbytes(3 * PIECE_LENGTH)
+    torrent = make_v2_torrent(tmp_path, data)
+
+    # Finishes well before HASH_TIMEOUT
+    manager, served = download(torrent, data, rejects=[True, True], corrupted=(1, 0), fake_peer=fake_peer)
+
+    assert [peer.asked for peer in manager.peers] == [1, 1]
+    assert len([offset for index, offset in served if index == 1]) == 8
+    with open(torrent.files[0]["path"], "rb") as f:
+        assert f.read() == data
+
+
+def test_hashes_are_only_requested_from_v2_peers(tmp_path, fake_peer, monkeypatch):
+    monkeypatch.setattr(manager_module, "HASH_PEERS", 4)
+    monkeypatch.setattr(manager_module, "HASH_TIMEOUT", 60)
+    data    = random.randbytes(3 * PIECE_LENGTH)
+    torrent = make_v2_torrent(tmp_path, data)
+
+    manager, served = download(torrent, data, rejects=[False], corrupted=(1, 0), fake_peer=fake_peer, v1_peers=3)
+
+    assert [peer.asked for peer in manager.peers] == [1, 0, 0, 0]
+    with open(torrent.files[0]["path"], "rb") as f:
+        assert f.read() == data
+
+
+def test_hash_request_needs_v2_handshake():
+    for v2 in (False, True):
+        handshake = Message.create_handshake(info_hash=bytes(20), peer_id=bytes(20), v2=v2)
+        assert Message.parse_handshake(handshake) == (bytes(20), bytes(20), v2)
+
+    class Writer:
+        def __init__(self):
+            self.data = b""
+
+        def write(self, data: bytes):
+            self.data += data
+
+    peer = Peer(peer_info={"ip": "127.0.0.1", "port": 7000}, info_hash=bytes(20), peer_id=bytes(20),
+                consume_queue=None, request_queue=None, complete=None, availability=[], hash_queue=object())
+    peer.connected, peer.writer = True, Writer()
+
+    # A v1-only peer never receives the message
+    assert not peer.request_hashes(pieces_root=bytes(32), index=0, length=4)
+    assert peer.writer.data == b""
+
+    peer.supports_v2 = True
+    assert peer.request_hashes(pieces_root=bytes(32), index=0, length=4)
+    assert peer.writer.data[4] == Message.HASH_REQUEST
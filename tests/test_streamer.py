@@ -0,0 +1,44 @@
+import asyncio
+import random
+
+import aiohttp
+
+from manager  import Manager
+from streamer import Streamer
+
+
+def test_range_request_and_startup_is_not_a_stall(make_torrent, free_port, fake_peer):
+    piece_length = 1 << 14
+    data         = random.randbytes(4 * piece_length + 100)
+    torrent      = make_torrent(data, piece_length)
+
+    async def run():
+        manager  = Manager(torrent=torrent, peers=[], streaming=True)
+        streamer = Streamer(manager=manager, name=torrent.name, port=free_port())
+        await streamer.start()
+
+        # A peer that only answers once the reader is already waiting
+        async def peer():
+            await asyncio.sleep(0.2)
+            await fake_peer(manager, data)
+
+        peer_task     = asyncio.create_task(peer())
+        download_task = asyncio.create_task(manager.download())
+
+        async with aiohttp.ClientSession() as session:
+            url = f"http://127.0.0.1:{streamer.port}/"
+            async with session.get(url, headers={"Range": "bytes=100-"}) as res:
+                assert res.status == 206
+                assert res.headers["Content-Range"] == f"bytes 100-{len(data) - 1}/{len(data)}"
+                body = await res.read()
+
+        await download_task
+        peer_task.cancel()
+        await streamer.stop()
+        return streamer, body
+
+    streamer, body = asyncio.run(run())
+
+    assert body == data[100:]
+    assert streamer.first_byte is not None
+    assert streamer.stalls == 0
@@ -0,0 +1,168 @@
+import socket
+import asyncio
+import random
+
+import pytest
+
+import utp
+from utp     import UTPSocket, HEADER, ST_SYN
+from manager import Manager
+from server  import Server
+from block   import BlockStatus
+
+
+def test_transfer_with_packet_loss(free_port, monkeypatch):
+    send = UTPSocket.send
+    rng  = random.Random(1)
+    monkeypatch.setattr(UTPSocket, "send", lambda self, data, addr: rng.random() < 0.03 or send(self, data, addr))
+
+    payload = random.randbytes(1 << 20)
+
+    async def run():
+        client = await UTPSocket.create(host="127.0.0.1", port=free_port(socket.SOCK_DGRAM), delay=0.005)
+        server = await UTPSocket.create(host="127.0.0.1", port=free_port(socket.SOCK_DGRAM), delay=0.005)
+
+        async def serve():
+            reader, writer = await server.accept()
+            data = await reader.readexactly(len(payload))
+            writer.write(data[:100])
+            await writer.drain()
+            writer.close()
+            return data
+
+        serve_task     = asyncio.create_task(serve())
+        reader, writer = await client.connect("127.0.0.1", server.transport.get_extra_info("sockname")[1])
+        writer.write(payload)
+        await writer.drain()
+
+        echo     = await reader.readexactly(100)
+        received = await serve_task
+        eof      = await reader.read()
+
+        client.close()
+        server.close()
+        return received, echo, eof
+
+    received, echo, eof = asyncio.run(run())
+
+    assert received == payload
+    assert echo == payload[:100]
+    assert eof == b""
+
+
+def test_connection_is_reset_without_acceptor(free_port):
+    async def run():
+        client = await UTPSocket.create(host="127.0.0.1", port=free_port(socket.SOCK_DGRAM))
+        server = await UTPSocket.create(host="127.0.0.1", port=free_port(socket.SOCK_DGRAM))
+
+        with pytest.raises(ConnectionRefusedError):
+            await asyncio.wait_for(client.connect("127.0.0.1", server.transport.get_extra_info("sockname")[1]),
+                                   timeout=2)
+
+        connections = len(server.connections)
+        client.close()
+        server.close()
+        return connections
+
+    assert asyncio.run(run()) == 0
+
+
+def test_duplicate_syn_keeps_connection_state(free_port):
+    async def run():
+        client = await UTPSocket.create(host="127.0.0.1", port=free_port(socket.SOCK_DGRAM))
+        server = await UTPSocket.create(host="127.0.0.1", port=free_port(socket.SOCK_DGRAM))
+        port   = server.transport.get_extra_info("sockname")[1]
+
+        accept_task    = asyncio.create_task(server.accept())
+        reader, writer = await client.connect("127.0.0.1", port)
+        server_reader, server_writer = await accept_task
+
+        writer.write(b"hello")
+        await writer.drain()
+        assert await server_reader.readexactly(5) == b"hello"
+
+        # Replay the SYN late: the server must not rewind ack_nr
+        connection = writer.connection
+        ack_nr     = server_writer.connection.ack_nr
+        syn        = HEADER.pack((ST_SYN << 4) | 1, 0, connection.recv_id, utp.now_micro(), 0,
+                                 utp.UTP_RECV_WINDOW, (connection.seq_nr - 2) & 0xffff, 0)
+        server.datagram_received(syn, ("127.0.0.1", client.transport.get_extra_info("sockname")[1]))
+        assert server_writer.connection.ack_nr == ack_nr
+
+        writer.write(b"world")
+        await writer.drain()
+        data = await asyncio.wait_for(server_reader.readexactly(5), timeout=2)
+
+        client.close()
+        server.close()
+        return data
+
+    assert asyncio.run(run()) == b"world"
+
+
+def test_closed_connections_leave_the_socket(free_port):
+    async def run():
+        client = await UTPSocket.create(host="127.0.0.1", port=free_port(socket.SOCK_DGRAM))
+        server = await UTPSocket.create(host="127.0.0.1", port=free_port(socket.SOCK_DGRAM))
+        port   = server.transport.get_extra_info("sockname")[1]
+
+        # The client only reads: the server's FIN is all it gets
+        accept_task    = asyncio.create_task(server.accept())
+        reader, writer = await client.connect("127.0.0.1", port)
+        server_reader, server_writer = await accept_task
+
+        server_writer.write(b"bye")
+        server_writer.close()
+        data = await asyncio.wait_for(reader.read(), timeout=2)
+        await asyncio.wait_for(server_writer.wait_closed(), timeout=2)
+
+        connections = (len(client.connections), len(server.connections))
+        client.close()
+        server.close()
+        return data, connections
+
+    assert asyncio.run(run()) == (b"bye", (0, 0))
+
+
+def test_download_from_server_over_utp(make_torrent, free_port):
+    piece_length = 1 << 14
+    data         = random.randbytes(6 * piece_length + 100)
+    torrent      = make_torrent(data, piece_length)
+
+    async def run():
+        port       = free_port()
+        seeder_utp = await UTPSocket.create(host="127.0.0.1", port=port)
+        client_utp = await UTPSocket.create(host="127.0.0.1", port=free_port(socket.SOCK_DGRAM))
+
+        # The first instance already has every piece
+        seeder = Manager(torrent=torrent, peers=[])
+        for block in seeder.blocks:
+            start        = block.index * piece_length + block.offset
+            block.data   = data[start:start + block.length]
+            block.status = BlockStatus.DOWNLOADED
+        seeder.verified = [True] * seeder.num_pieces
+
+        accepted = []
+        accept   = seeder_utp.accept
+
+        async def counting_accept():
+            streams = await accept()
+            accepted.append(streams)
+            return streams
+        seeder_utp.accept = counting_accept
+
+        server = Server(manager=seeder, port=port, host="127.0.0.1", utp=seeder_utp)
+        await server.start()
+
+        leecher = Manager(torrent=torrent, peers=[{"ip": "127.0.0.1", "port": port}], utp=client_utp)
+        try:
+            await asyncio.wait_for(leecher.download(), timeout=20)
+        finally:
+            await server.stop()
+            seeder_utp.close()
+            client_utp.close()
+        return len(accepted)
+
+    assert asyncio.run(run()) == 1
+    with open(torrent.files[0]["path"], "rb") as f:
+        assert f.read() == data
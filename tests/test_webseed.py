@@ -0,0 +1,146 @@
+import asyncio
+import random
+
+from aiohttp import web
+
+from manager  import Manager
+from constant import WEBSEED_CONNECTIONS, WEBSEED_MAX_FAILURES
+
+
+def test_download_from_static_web_seed(make_torrent, free_port, tmp_path):
+    piece_length = 1 << 18
+    data         = random.randbytes(10 * (1 << 20) + 1000)
+
+    seed_dir = tmp_path / "seed"
+    seed_dir.mkdir()
+    (seed_dir / "file.bin").write_bytes(data)
+
+    async def run():
+        requests = []
+
+        @web.middleware
+        async def count(request, handler):
+            requests.append(request.headers.get("Range"))
+            return await handler(request)
+
+        app = web.Application(middlewares=[count])
+        app.router.add_static("/seed", seed_dir)
+
+        runner = web.AppRunner(app)
+        await runner.setup()
+        port = free_port()
+        await web.TCPSite(runner, host="127.0.0.1", port=port).start()
+
+        torrent = make_torrent(data, piece_length, {b"url-list": f"http://127.0.0.1:{port}/seed/file.bin".encode()})
+        manager = Manager(torrent=torrent, peers=[])
+        await asyncio.wait_for(manager.download(), timeout=60)
+
+        await runner.cleanup()
+        return torrent, requests
+
+    torrent, requests = asyncio.run(run())
+
+    with open(torrent.files[0]["path"], "rb") as f:
+        assert f.read() == data
+
+    # One Range request per piece, no piece fetched twice
+    assert len(requests) == torrent.num_pieces == 41
+    assert len(set(requests)) == len(requests)
+
+
+def test_seed_ignoring_ranges_is_dropped(make_torrent, free_port, tmp_path):
+    piece_length = 1 << 18
+    data         = random.randbytes(4 * (1 << 20))
+
+    seed_dir = tmp_path / "seed"
+    seed_dir.mkdir()
+    (seed_dir / "file.bin").write_bytes(data)
+
+    async def run():
+        requests = []
+
+        @web.middleware
+        async def count(request, handler):
+            requests.append(request.path)
+            return await handler(request)
+
+        # Answers every request with the whole file
+        async def full(request):
+            return web.Response(body=data)
+
+        app = web.Application(middlewares=[count])
+        app.router.add_static("/seed", seed_dir)
+        app.router.add_get("/full/file.bin", full)
+
+        runner = web.AppRunner(app)
+        await runner.setup()
+        port = free_port()
+        await web.TCPSite(runner, host="127.0.0.1", port=port).start()
+
+        urls    = [f"http://127.0.0.1:{port}/full/file.bin".encode(), f"http://127.0.0.1:{port}/seed/file.bin".encode()]
+        torrent = make_torrent(data, piece_length, {b"url-list": urls})
+        manager = Manager(torrent=torrent, peers=[])
+        await asyncio.wait_for(manager.download(), timeout=30)
+
+        await runner.cleanup()
+        return torrent, requests
+
+    torrent, requests = asyncio.run(run())
+
+    with open(torrent.files[0]["path"], "rb") as f:
+        assert f.read() == data
+
+    # At most one request per connection before the seed is dropped
+    assert requests.count("/full/file.bin") <= WEBSEED_CONNECTIONS
+    assert requests.count("/seed/file.bin") == torrent.num_pieces
+
+
+def test_seed_sending_bad_data_is_dropped(make_torrent, free_port, tmp_path):
+    piece_length = 1 << 16
+    data         = random.randbytes(4 * (1 << 20))
+
+    seed_dir = tmp_path / "seed"
+    seed_dir.mkdir()
+    (seed_dir / "file.bin").write_bytes(data)
+
+    async def run():
+        requests = []
+
+        # The good server is slow, so the bad one gets every chance to send more
+        @web.middleware
+        async def count(request, handler):
+            requests.append(request.path)
+            if request.path.startswith("/seed"):
+                await asyncio.sleep(0.1)
+            return await handler(request)
+
+        # Honors ranges, but only sends zeros
+        async def corrupt(request):
+            start, end = map(int, request.headers["Range"][len("bytes="):].split("-"))
+            return web.Response(status=206, body=bytes(end - start + 1),
+                                headers={"Content-Range": f"bytes {start}-{end}/{len(data)}"})
+
+        app = web.Application(middlewares=[count])
+        app.router.add_static("/seed", seed_dir)
+        app.router.add_get("/corrupt/file.bin", corrupt)
+
+        runner = web.AppRunner(app)
+        await runner.setup()
+        port = free_port()
+        await web.TCPSite(runner, host="127.0.0.1", port=port).start()
+
+        urls    = [f"http://127.0.0.1:{port}/corrupt/file.bin".encode(), f"http://127.0.0.1:{port}/seed/file.bin".encode()]
+        torrent = make_torrent(data, piece_length, {b"url-list": urls})
+        manager = Manager(torrent=torrent, peers=[])
+        await asyncio.wait_for(manager.download(), timeout=30)
+
+        await runner.cleanup()
+        return torrent, requests
+
+    torrent, requests = asyncio.run(run())
+
+    with open(torrent.files[0]["path"], "rb") as f:
+        assert f.read() == data
+
+    # Pieces fetched before the failures were counted are the only extra ones
+    assert requests.count("/corrupt/file.bin") <= 2 * (WEBSEED_MAX_FAILURES + WEBSEED_CONNECTIONS)
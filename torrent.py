@@ -2,18 +2,29 @@ import os
 import hashlib
 import bencodepy
 
+import merkle
+from   constant import *
+
 
 class Torrent:
 
     def __init__(self, data: dict):
         self.data           = data
         self.info           = data[b"info"]
+        self.meta_version   = self.info.get(b"meta version", 1)
+        self.info_hash_v2   = hashlib.sha256(bencodepy.encode(self.info)).digest() if self.meta_version == 2 else None
         self.info_hash      = self.get_info_hash()
         self.announce_url   = data[b"announce"].decode("utf-8")
         self.piece_length   = self.info[b"piece length"]
-        self.pieces         = self.info[b"pieces"]
+        self.pieces         = self.info.get(b"pieces", b"")
         self.announce_list  = self.data.get(b"announce-list", [])
         
+        # Set web seeds (BEP 19), either a single URL or a list of URLs
+        url_list = self.data.get(b"url-list", [])
+        if isinstance(url_list, bytes):
+            url_list = [url_list]
+        self.url_list = [url.decode("utf-8") for url in url_list if url]
+        
         # Set name
         self.name = self.info[b"name"].decode("utf-8")
         
@@ -23,7 +34,7 @@ class Torrent:
             self.total_size      = self.info[b"length"]
             self.files           = [{"path": self.name, "length": self.total_size}]
             self.is_single_file  = True
-        else:
+        elif b"files" in self.info:
             # Multi-file torrent
             self.files       = []
             self.total_size  = 0
@@ -38,8 +49,72 @@ class Torrent:
             
         # Calculate number of pieces
         self.num_pieces = len(self.pieces) // 20
+        
+        # v2 and hybrid torrents are verified with merkle trees instead
+        self.piece_hashes = []
+        if self.meta_version == 2:
+            self.__parse_file_tree()
+
+    def __walk_file_tree(self, tree: dict, parts: list):
+        for name, node in tree.items():
+            if name == b"":
+                yield parts, node
+            else:
+                yield from self.__walk_file_tree(node, parts + [name.decode("utf-8")])
+
+    def __parse_file_tree(self):
+        piece_layers = self.data.get(b"piece layers", {})
+        leaves       = self.piece_length // MERKLE_BLOCK_SIZE
+        entries      = list(self.__walk_file_tree(self.info[b"file tree"], []))
+        
+        self.files          = []
+        self.total_size     = 0
+        self.is_single_file = len(entries) == 1 and len(entries[0][0]) == 1
+        
+        # Every file starts on a piece boundary
+        for parts, node in entries:
+            file_size = node[b"length"]
+            file_name = parts[0] if self.is_single_file else os.path.join(self.name, *parts)
+            file_root = node.get(b"pieces root", b"")
+            
+            self.files.append({"path": file_name, "length": file_size,
+                               "offset": len(self.piece_hashes) * self.piece_length, "pieces root": file_root})
+            self.total_size += file_size
+            
+            if file_size == 0:
+                continue
+            
+            if file_size <= self.piece_length:
+                # Single piece file: the piece hash is the file root
+                width = merkle.next_power_of_two(-(-file_size // MERKLE_BLOCK_SIZE))
+                self.piece_hashes.append({"root": file_root, "leaf": 0, "width": width,
+                                          "hash": file_root, "length": file_size})
+                continue
+            
+            layer  = piece_layers.get(file_root, b"")
+            hashes = [layer[i:i + 32] for i in range(0, len(layer), 32)]
+            count  = -(-file_size // self.piece_length)
+            
+            width = merkle.next_power_of_two(count)
+            if len(hashes) != count or merkle.root(hashes, width, merkle.pad_hash(leaves)) != file_root:
+                raise ValueError(f"Piece layer of {file_name} does not match its pieces root")
+            
+            for i, piece_hash in enumerate(hashes):
+                self.piece_hashes.append({"root": file_root, "leaf": i * leaves, "width": leaves,
+                                          "hash": piece_hash,
+                                          "length": min(self.piece_length, file_size - i * self.piece_length)})
+        
+        self.num_pieces = len(self.piece_hashes)
+
+    def piece_size(self, index: int) -> int:
+        if self.piece_hashes:
+            return self.piece_hashes[index]["length"]
+        return min(self.piece_length, self.total_size - index * self.piece_length)
 
     def get_info_hash(self) -> bytes:
+        # v2-only torrents are announced with the truncated SHA-256 info hash
+        if b"pieces" not in self.info:
+            return self.info_hash_v2[:20]
         return hashlib.sha1(bencodepy.encode(self.info)).digest()
     
     @classmethod
@@ -64,6 +139,7 @@ class Torrent:
         print("-" * 50)
         print(f"\033[1;32m  Torrent Name:\033[0m {self.name}")
         print(f"\033[1;32m  Primary Tracker:\033[0m {self.announce_url}")
+        print(f"\033[1;32m  Web Seeds:\033[0m {len(self.url_list)}")
         
         # print("-" * 50) 
         # print(f"\033[1;32m  Secondary Trackers:\033[0m")
@@ -72,6 +148,8 @@ class Torrent:
         print("-" * 50)
 
         print(f"\033[1;32m  Torrent Hash:\033[0m \033[1;35m{self.info_hash.hex()}\033[0m")
+        if self.info_hash_v2 is not None:
+            print(f"\033[1;32m  Torrent Hash (v2):\033[0m \033[1;35m{self.info_hash_v2.hex()}\033[0m")
         print("-" * 50)
         print(f"\033[1;32m  Piece Size:\033[0m {self.human_readable_size(self.piece_length)}")
         print(f"\033[1;32m  Num Pieces:\033[0m {self.num_pieces}")
@@ -0,0 +1,527 @@
+import time
+import struct
+import random
+import asyncio
+from   collections import OrderedDict
+from   typing      import Dict, Optional, Tuple
+
+from constant import *
+from printing import *
+
+
+# Packet types
+ST_DATA  = 0
+ST_FIN   = 1
+ST_STATE = 2
+ST_RESET = 3
+ST_SYN   = 4
+
+# Connection states
+CS_SYN_SENT  = 0
+CS_CONNECTED = 1
+CS_CLOSED    = 2
+
+HEADER = struct.Struct(">BBHIIIHH")
+
+
+def now_micro() -> int:
+    return int(time.monotonic() * 1000000) & 0xffffffff
+
+def seq_diff(a: int, b: int) -> int:
+    # Signed distance between two 16-bit sequence numbers
+    return ((a - b + 0x8000) & 0xffff) - 0x8000
+
+
+class Packet:
+    def __init__(self, type: int, seq_nr: int, payload: bytes = b""):
+        self.type          = type
+        self.seq_nr        = seq_nr
+        self.payload       = payload
+        self.sent_at       = 0.0     # Last time the packet was sent
+        self.transmissions = 0       # Times the packet was sent
+
+
+class UTPConnection:
+    def __init__(self, socket: "UTPSocket", addr: Tuple[str, int], recv_id: int, send_id: int):
+        self.socket   = socket
+        self.addr     = addr
+        self.recv_id  = recv_id
+        self.send_id  = send_id
+        self.state    = CS_SYN_SENT
+
+        self.seq_nr   = random.randint(0, 0xffff)  # Next sequence number to send
+        self.ack_nr   = 0                          # Last in-order sequence number received
+
+        # Sending side
+        self.send_buffer    = bytearray()
+        self.inflight       = OrderedDict()       # seq_nr -> Packet
+        self.bytes_inflight = 0
+        self.closing        = False
+        self.fin_sent       = False
+        self.drained        = asyncio.Event()
+        self.drained.set()
+
+        # Receiving side
+        self.reader      = asyncio.StreamReader()
+        self.out_order   = {}                     # seq_nr -> payload
+        self.fin_seq     = None
+        self.eof         = False                  # The remote's FIN was delivered
+        self.reply_micro = 0                      # Delay measured on the last received packet
+
+        # Congestion control
+        self.cwnd        = 2 * UTP_MSS
+        self.peer_wnd    = UTP_MSS
+        self.base_delays = [(0, 0xffffffff)]      # (minute, lowest delay)
+        self.dup_acks    = 0
+        self.srtt        = None
+        self.rttvar      = 0.0
+        self.rto         = 1.0
+        self.timeouts    = 0
+
+        # Statistics
+        self.queuing_delay = 0                    # Last queuing delay sample (microseconds)
+        self.bytes_sent    = 0
+        self.bytes_acked   = 0
+
+        self.connected = asyncio.Event()
+        self.closed    = asyncio.Event()
+
+    """
+
+    Outgoing data is appended to a send buffer, cut into packets of at most UTP_MSS
+    bytes and sent as long as the bytes in flight fit in the congestion window and in
+    the window advertised by the remote end
+
+    """
+
+    def __send(self, type: int, seq_nr: int, payload: bytes = b""):
+        extension = 0
+        extras    = b""
+
+        # Selective ACK of packets received past ack_nr + 1
+        if self.out_order:
+            mask = 0
+            for i in range(32):
+                if ((self.ack_nr + 2 + i) & 0xffff) in self.out_order:
+                    mask |= 1 << i
+            extension = 1
+            extras    = bytes([0, 4]) + mask.to_bytes(4, "little")
+
+        # The SYN carries our own ID, every other packet the remote's one
+        conn_id = self.recv_id if type == ST_SYN else self.send_id
+        header  = HEADER.pack((type << 4) | 1, extension, conn_id, now_micro(), self.reply_micro,
+                             UTP_RECV_WINDOW, seq_nr, self.ack_nr)
+        self.socket.send(header + extras + payload, self.addr)
+
+    def __transmit(self, packet: Packet):
+        packet.sent_at        = time.monotonic()
+        packet.transmissions += 1
+        self.__send(packet.type, packet.seq_nr, packet.payload)
+
+    def __queue(self, type: int, payload: bytes = b""):
+        packet = Packet(type=type, seq_nr=self.seq_nr, payload=payload)
+        self.seq_nr = (self.seq_nr + 1) & 0xffff
+
+        self.inflight[packet.seq_nr] = packet
+        self.bytes_inflight += len(payload)
+        self.bytes_sent     += len(payload)
+        self.__transmit(packet)
+
+    def flush(self):
+        if self.state != CS_CONNECTED:
+            return
+
+        while self.send_buffer:
+            size = min(len(self.send_buffer), UTP_MSS)
+            if self.inflight and self.bytes_inflight + size > min(self.cwnd, self.peer_wnd):
+                break
+
+            payload = bytes(self.send_buffer[:size])
+            del self.send_buffer[:size]
+            self.__queue(ST_DATA, payload)
+
+        if len(self.send_buffer) < UTP_SEND_BUFFER:
+            self.drained.set()
+
+        if self.closing and not self.send_buffer and not self.fin_sent:
+            self.fin_sent = True
+            self.__queue(ST_FIN)
+
+    def connect(self):
+        self.__queue(ST_SYN)
+
+    def accept(self, syn_seq: int):
+        self.ack_nr = syn_seq
+        self.state  = CS_CONNECTED
+        self.connected.set()
+        self.send_state()
+
+    def send_state(self):
+        self.__send(ST_STATE, self.seq_nr)
+
+    """
+
+    LEDBAT: every ACK carries the one-way delay the remote end measured on our last
+    packet. The lowest delay seen in the last minutes is taken as the base delay, and
+    anything above it is queuing. The window grows while queuing stays below the
+    target and shrinks once it goes above, so uTP yields to other traffic
+
+    """
+
+    def __update_base_delay(self, delay: int) -> int:
+        minute = int(time.monotonic() // 60)
+
+        if self.base_delays[-1][0] != minute:
+            self.base_delays.append((minute, delay))
+            self.base_delays = self.base_delays[-UTP_BASE_HISTORY:]
+        elif delay < self.base_delays[-1][1]:
+            self.base_delays[-1] = (minute, delay)
+
+        return min(lowest for _, lowest in self.base_delays)
+
+    def __update_cwnd(self, acked: int, delay: int):
+        if delay == 0:
+            return
+
+        base_delay         = self.__update_base_delay(delay)
+        self.queuing_delay = (delay - base_delay) & 0xffffffff
+
+        off_target = (UTP_TARGET - self.queuing_delay) / UTP_TARGET
+        cwnd       = self.cwnd + UTP_GAIN * off_target * acked * UTP_MSS / self.cwnd
+
+        # The window only grows while it is actually used
+        if cwnd > self.cwnd:
+            max_allowed = self.bytes_inflight + acked + UTP_ALLOWED_INCREASE * UTP_MSS
+            cwnd        = min(cwnd, max(self.cwnd, max_allowed))
+        self.cwnd = max(cwnd, UTP_MSS)
+
+    def __update_rtt(self, sample: float):
+        if self.srtt is None:
+            self.srtt   = sample
+            self.rttvar = sample / 2
+        else:
+            self.rttvar += (abs(self.srtt - sample) - self.rttvar) / 4
+            self.srtt   += (sample - self.srtt) / 8
+        self.rto = max(self.srtt + 4 * self.rttvar, UTP_MIN_RTO)
+
+    def __acked(self, packet: Packet):
+        del self.inflight[packet.seq_nr]
+        self.bytes_inflight -= len(packet.payload)
+        self.bytes_acked    += len(packet.payload)
+
+        if packet.transmissions == 1:
+            self.__update_rtt(time.monotonic() - packet.sent_at)
+
+    def __process_ack(self, type: int, ack_nr: int, sack: Optional[bytes], delay: int):
+        acked = 0
+
+        for packet in list(self.inflight.values()):
+            distance = seq_diff(packet.seq_nr, ack_nr)
+
+            if distance <= 0:
+                acked += len(packet.payload)
+                self.__acked(packet)
+            elif sack is not None and distance >= 2:
+                bit = distance - 2
+                if bit < len(sack) * 8 and sack[bit // 8] & (1 << (bit % 8)):
+                    acked += len(packet.payload)
+                    self.__acked(packet)
+
+        if acked or not self.inflight:
+            self.dup_acks = 0
+            self.timeouts = 0
+        elif type == ST_STATE:
+            self.dup_acks += 1
+
+        if acked:
+            self.__update_cwnd(acked, delay)
+
+        # Fast retransmit when three later packets made it (duplicate or selective ACKs)
+        if self.inflight:
+            oldest = next(iter(self.inflight.values()))
+            sacked = 0
+            if sack is not None:
+                sacked = sum(bin(byte).count("1") for byte in sack)
+
+            if (self.dup_acks >= 3 or sacked >= 3) and oldest.transmissions == 1:
+                self.cwnd = max(self.cwnd / 2, UTP_MSS)
+                self.__transmit(oldest)
+
+        if self.__finished():
+            self.close_now()
+
+    def __finished(self) -> bool:
+        # Done once our FIN is acknowledged, or once the remote closed and we have
+        # nothing left to send (otherwise an idle connection would stay forever)
+        if self.inflight:
+            return False
+        return self.fin_sent or (self.eof and not self.send_buffer)
+
+    def __deliver(self, seq_nr: int, payload: bytes):
+        distance = seq_diff(seq_nr, self.ack_nr)
+
+        if distance == 1:
+            self.ack_nr = seq_nr
+            if payload:
+                self.reader.feed_data(payload)
+
+            # Deliver packets that were waiting for this one
+            while ((self.ack_nr + 1) & 0xffff) in self.out_order:
+                self.ack_nr = (self.ack_nr + 1) & 0xffff
+                payload     = self.out_order.pop(self.ack_nr)
+                if payload:
+                    self.reader.feed_data(payload)
+
+        elif 1 < distance < UTP_RECV_WINDOW // UTP_MSS:
+            self.out_order[seq_nr] = payload
+
+        if self.fin_seq is not None and self.ack_nr == self.fin_seq:
+            self.reader.feed_eof()
+            self.eof = True
+
+    def packet_received(self, type: int, timestamp: int, delay: int, wnd_size: int,
+                              seq_nr: int, ack_nr: int, sack: Optional[bytes], payload: bytes):
+
+        self.reply_micro = (now_micro() - timestamp) & 0xffffffff
+        self.peer_wnd    = max(wnd_size, UTP_MSS)
+
+        if type == ST_RESET:
+            self.reader.set_exception(ConnectionResetError("uTP connection reset"))
+            self.close_now()
+            return
+
+        if self.state == CS_SYN_SENT:
+            if type != ST_STATE:
+                return
+            # The SYN-ACK does not consume a sequence number
+            self.ack_nr = (seq_nr - 1) & 0xffff
+            self.state  = CS_CONNECTED
+            self.connected.set()
+
+        self.__process_ack(type, ack_nr, sack, delay)
+
+        if type in (ST_DATA, ST_FIN):
+            if type == ST_FIN:
+                self.fin_seq = seq_nr
+            self.__deliver(seq_nr, payload)
+            self.__send(ST_STATE, self.seq_nr)
+
+        self.flush()
+        if self.state != CS_CLOSED and self.__finished():
+            self.close_now()
+
+    def tick(self):
+        if not self.inflight:
+            return
+
+        oldest = next(iter(self.inflight.values()))
+        if time.monotonic() - oldest.sent_at < self.rto:
+            return
+
+        self.timeouts += 1
+        if self.timeouts > UTP_MAX_RETRANSMITS:
+            self.reader.set_exception(ConnectionResetError("uTP connection timed out"))
+            self.__send(ST_RESET, self.seq_nr)
+            self.close_now()
+            return
+
+        self.cwnd = UTP_MSS
+        self.rto  = min(self.rto * 2, 60)
+        self.__transmit(oldest)
+
+    def close_now(self):
+        self.state = CS_CLOSED
+        self.drained.set()
+        self.connected.set()
+        self.closed.set()
+        self.socket.remove(self)
+
+
+class UTPStream:
+
+    """
+
+    Writer half of a uTP connection, with the subset of asyncio.StreamWriter used
+    by the peer wire protocol
+
+    """
+
+    def __init__(self, connection: UTPConnection):
+        self.connection = connection
+
+    def write(self, data: bytes):
+        if self.connection.state == CS_CLOSED:
+            raise ConnectionResetError("uTP connection closed")
+
+        self.connection.send_buffer += data
+        if len(self.connection.send_buffer) >= UTP_SEND_BUFFER:
+            self.connection.drained.clear()
+        self.connection.flush()
+
+    async def drain(self):
+        await self.connection.drained.wait()
+        if self.connection.state == CS_CLOSED and self.connection.send_buffer:
+            raise ConnectionResetError("uTP connection closed")
+
+    def close(self):
+        self.connection.closing = True
+        self.connection.flush()
+
+    def is_closing(self) -> bool:
+        return self.connection.closing or self.connection.state == CS_CLOSED
+
+    def get_extra_info(self, name: str, default=None):
+        if name == "peername":
+            return self.connection.addr
+        return default
+
+    async def wait_closed(self):
+        await self.connection.closed.wait()
+
+
+class UTPSocket(asyncio.DatagramProtocol):
+
+    """
+
+    A single UDP socket carries every uTP connection. Incoming packets are routed by
+    the remote address and the connection ID. The optional delay and rate emulate a
+    bottleneck link in-process (netem-style), to measure LEDBAT on loopback
+
+    """
+
+    def __init__(self, delay: float = 0.0, rate: Optional[float] = None):
+        self.delay    = delay
+        self.rate     = rate            # Bytes per second, None for unlimited
+        self.link_free_at = 0.0
+
+        self.connections: Dict[Tuple[Tuple[str, int], int], UTPConnection] = {}
+        self.incoming    = asyncio.Queue()
+        self.listening   = False        # Set once someone calls accept()
+
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self.task:      Optional[asyncio.Task] = None
+
+    @classmethod
+    async def create(cls, host: str = "0.0.0.0", port: int = LISTEN_PORT, **kwargs) -> "UTPSocket":
+        loop = asyncio.get_running_loop()
+        sock = cls(**kwargs)
+        await loop.create_datagram_endpoint(lambda: sock, local_addr=(host, port))
+        sock.task = asyncio.create_task(sock.__tick())
+        return sock
+
+    def connection_made(self, transport: asyncio.DatagramTransport):
+        self.transport = transport
+
+    def error_received(self, exc: Exception):
+        pass
+
+    def send(self, data: bytes, addr: Tuple[str, int]):
+        if self.transport is None or self.transport.is_closing():
+            return
+
+        if not self.delay and self.rate is None:
+            self.transport.sendto(data, addr)
+            return
+
+        # Packets queue behind each other on the emulated link, then travel for delay seconds
+        loop    = asyncio.get_running_loop()
+        departs = loop.time()
+        if self.rate is not None:
+            departs           = max(departs, self.link_free_at) + len(data) / self.rate
+            self.link_free_at = departs
+        loop.call_at(departs + self.delay, self.__sendto, data, addr)
+
+    def __sendto(self, data: bytes, addr: Tuple[str, int]):
+        if not self.transport.is_closing():
+            self.transport.sendto(data, addr)
+
+    def datagram_received(self, data: bytes, addr):
+        if len(data) < HEADER.size:
+            return
+
+        type_ver, extension, conn_id, timestamp, delay, wnd_size, seq_nr, ack_nr = HEADER.unpack_from(data)
+        type, version = type_ver >> 4, type_ver & 0x0f
+        if version != 1 or type > ST_SYN:
+            return
+
+        # Walk the extension chain, keeping the selective ACK bitmask
+        sack   = None
+        offset = HEADER.size
+        while extension:
+            if offset + 2 > len(data):
+                return
+            next_extension, length = data[offset], data[offset + 1]
+            if extension == 1:
+                sack = data[offset + 2:offset + 2 + length]
+            offset   += 2 + length
+            extension = next_extension
+        payload = data[offset:]
+
+        addr = addr[:2]
+        if type == ST_SYN:
+            connection = self.connections.get((addr, (conn_id + 1) & 0xffff))
+            if connection is not None:
+                # Duplicate SYN: the STATE was lost, the connection state is kept
+                connection.send_state()
+            elif not self.listening or self.incoming.qsize() >= UTP_BACKLOG:
+                self.__reset(addr, conn_id, seq_nr)
+            else:
+                connection = UTPConnection(socket=self, addr=addr,
+                                           recv_id=(conn_id + 1) & 0xffff, send_id=conn_id)
+                self.connections[(addr, connection.recv_id)] = connection
+                connection.accept(seq_nr)
+                self.incoming.put_nowait(connection)
+            return
+
+        connection = self.connections.get((addr, conn_id))
+        if connection is not None:
+            connection.packet_received(type, timestamp, delay, wnd_size, seq_nr, ack_nr, sack, payload)
+
+    def __reset(self, addr: Tuple[str, int], conn_id: int, ack_nr: int):
+        # Refuse a connection nobody is going to accept
+        header = HEADER.pack((ST_RESET << 4) | 1, 0, conn_id, now_micro(), 0, 0,
+                             random.randint(0, 0xffff), ack_nr)
+        self.send(header, addr)
+
+    async def __tick(self):
+        while True:
+            await asyncio.sleep(UTP_TICK)
+            for connection in list(self.connections.values()):
+                connection.tick()
+
+    def remove(self, connection: UTPConnection):
+        self.connections.pop((connection.addr, connection.recv_id), None)
+
+    async def connect(self, host: str, port: int) -> Tuple[asyncio.StreamReader, UTPStream]:
+        addr    = (host, port)
+        recv_id = random.randint(0, 0xffff)
+        while (addr, recv_id) in self.connections:
+            recv_id = random.randint(0, 0xffff)
+
+        connection = UTPConnection(socket=self, addr=addr, recv_id=recv_id, send_id=(recv_id + 1) & 0xffff)
+        self.connections[(addr, recv_id)] = connection
+        connection.connect()
+
+        try:
+            await connection.connected.wait()
+        except asyncio.CancelledError:
+            connection.close_now()
+            raise
+
+        if connection.state != CS_CONNECTED:
+            raise ConnectionRefusedError(f"uTP connection to {host}:{port} failed")
+        return connection.reader, UTPStream(connection)
+
+    async def accept(self) -> Tuple[asyncio.StreamReader, UTPStream]:
+        # Incoming connections are refused until the first call
+        self.listening = True
+        connection = await self.incoming.get()
+        return connection.reader, UTPStream(connection)
+
+    def close(self):
+        if self.task is not None:
+            self.task.cancel()
+        for connection in list(self.connections.values()):
+            connection.close_now()
+        if self.transport is not None:
+            self.transport.close()
@@ -0,0 +1,157 @@
+import os
+import asyncio
+import aiohttp
+import urllib.parse
+from   typing import List, Tuple
+
+from constant import *
+from printing import *
+from torrent  import Torrent
+from block    import Block, BlockStatus
+
+
+class WebSeed:
+    def __init__(self, url:           str,
+                       torrent:       Torrent,
+                       session:       aiohttp.ClientSession,
+                       consume_queue: asyncio.Queue,
+                       request_queue: asyncio.Queue,
+                       complete:      asyncio.Event,
+                       block_size:    int,
+                       verified:      list,
+                       pending:       set,
+                       failures:      dict):
+
+        self.url           = url
+        self.torrent       = torrent
+        self.session       = session
+        self.piece_size    = torrent.piece_length
+        self.block_size    = block_size
+
+        self.consume_queue = consume_queue
+        self.request_queue = request_queue
+        self.complete      = complete
+        self.verified      = verified
+
+        # Pieces fetched and not yet verified, shared by all web seeds (the manager
+        # removes a piece when it drops its data)
+        self.pending = pending
+
+        # Verification failures by source, counted by the manager
+        self.failures = failures
+
+        # Map the torrent's byte space onto the server's files
+        self.files = self.__map_files(torrent)
+
+        # Set when the server cannot be used anymore
+        self.stopped = False
+
+    def __map_files(self, torrent: Torrent) -> List[Tuple[int, int, str]]:
+        files  = []
+        offset = 0
+
+        for file in torrent.files:
+            if torrent.is_single_file and not self.url.endswith("/"):
+                url = self.url
+            else:
+                parts = file["path"].split(os.sep)
+                url   = self.url.rstrip("/") + "/" + "/".join(urllib.parse.quote(part) for part in parts)
+
+            # v2 files start on a piece boundary
+            offset = file.get("offset", offset)
+            files.append((offset, file["length"], url))
+            offset += file["length"]
+
+        return files
+
+    """
+
+    A web seed serves whole pieces: the first block of a piece taken from the queue
+    triggers one HTTP Range request per file the piece spans, and every block of the
+    piece is then handed to the manager, which verifies it like any peer data
+
+    """
+
+    async def __fetch(self, start: int, length: int) -> bytes:
+        chunks = []
+
+        for file_start, file_length, url in self.files:
+            file_end = file_start + file_length
+            if file_length == 0 or file_end <= start or file_start >= start + length:
+                continue
+
+            lo = max(start, file_start) - file_start
+            hi = min(start + length, file_end) - file_start
+
+            headers = {"Range": f"bytes={lo}-{hi - 1}"}
+            async with self.session.get(url, headers=headers) as res:
+                if res.status == 206 or (res.status == 200 and lo == 0 and hi == file_length):
+                    data = await res.read()
+                elif res.status == 200:
+                    # The server ignores ranges: every piece would cost the whole file,
+                    # so leave without reading the body (the connection is dropped)
+                    self.stopped = True
+                    raise Exception(f"{url} does not support Range requests")
+                else:
+                    raise Exception(f"HTTP status {res.status} for {url}")
+
+            if len(data) != hi - lo:
+                raise Exception(f"Expected {hi - lo} bytes from {url}, got {len(data)}")
+            chunks.append(data)
+
+        return b"".join(chunks)
+
+    async def __request_data(self):
+        while not self.complete.is_set() and not self.stopped:
+            block: Block = await self.request_queue.get()
+            self.request_queue.task_done()
+
+            # A server that keeps sending bad data is not used anymore
+            if self.failures.get(self.url, 0) >= WEBSEED_MAX_FAILURES:
+                self.stopped = True
+
+            if self.stopped:
+                await self.request_queue.put(block)
+                break
+
+            # The picker queues the same blocks again until they arrive
+            if (block.status == BlockStatus.DOWNLOADED or self.verified[block.index]
+                    or block.index in self.pending):
+                continue
+
+            piece_start  = block.index * self.piece_size
+            piece_length = self.torrent.piece_size(block.index)
+
+            self.pending.add(block.index)
+            try:
+                data = await asyncio.wait_for(self.__fetch(piece_start, piece_length), timeout=WEBSEED_TIMEOUT)
+            except Exception as err:
+                print_yellow(f"[WEBSEED={self.url}]: Request for piece {block.index} failed: {err}")
+                self.pending.discard(block.index)
+                await self.request_queue.put(block)
+                if not self.stopped:
+                    await asyncio.sleep(WEBSEED_RETRY)
+                continue
+
+            for offset in range(0, piece_length, self.block_size):
+                payload = data[offset:offset + self.block_size]
+                res     = Block(index=block.index, offset=offset, length=len(payload),
+                                data=payload, status=BlockStatus.DOWNLOADED)
+                await self.consume_queue.put((res, self.url, None))
+
+    """
+
+    The method download is used to trigger the runtime of the web seed
+
+    """
+
+    async def download(self):
+        workers = [asyncio.create_task(self.__request_data()) for _ in range(WEBSEED_CONNECTIONS)]
+
+        try:
+            await asyncio.gather(*workers)
+            if self.stopped:
+                print_yellow(f"[WEBSEED={self.url}]: No longer used")
+        finally:
+            for worker in workers:
+                worker.cancel()